@@ -0,0 +1,63 @@
+"""Benchmark of aggregate_lags_hierarchy against the merge-based aggregation.
+
+Run from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/aggregate_lags.py --n-items 3049 --n-days 1941
+"""
+
+import argparse
+
+import numpy as np
+
+from benchmarks.utils import make_sales_data, time_function
+from components.base_images.tutorial.features_engineering.lags_and_rolling import (
+    aggregate_lags_hierarchy,
+    get_lags,
+)
+
+
+def merge_aggregate_lags(df, lags, group_by, target="sales", date="date"):
+    """Previous implementation: one groupby and one merge per lag."""
+    for lag in lags:
+        group = (
+            df.groupby([date, group_by])[f"{target}_lag_{lag}"]
+            .mean()
+            .to_frame()
+            .rename(columns={f"{target}_lag_{lag}": f"{target}_lag_{lag}_{group_by}"})
+        )
+        df = df.merge(group, left_on=[date, group_by], right_index=True)
+    return df
+
+
+def merge_aggregate_levels(df, lags, levels):
+    for level in levels:
+        df = merge_aggregate_lags(df, lags, level)
+    return df
+
+
+_parser = argparse.ArgumentParser()
+_parser.add_argument("--n-items", type=int, default=3049)
+_parser.add_argument("--n-days", type=int, default=1941)
+_parser.add_argument("--levels", nargs="+", default=["cat_id", "dept_id"])
+
+if __name__ == "__main__":
+    args = _parser.parse_args()
+    lags = list(range(14, 21)) + [365]
+    df = get_lags(make_sales_data(args.n_items, args.n_days), lags=lags)
+    print(f"{len(df)} rows, {len(lags)} lags, levels {args.levels}")
+
+    merged, merge_time = time_function(merge_aggregate_levels, df, lags, args.levels)
+    hierarchy, hierarchy_time = time_function(
+        aggregate_lags_hierarchy, df, lags, args.levels
+    )
+    print(f"merge: {merge_time:.2f}s, hierarchy: {hierarchy_time:.2f}s")
+
+    keys = ["item_id", "date"]
+    merged = merged.sort_values(keys).reset_index(drop=True)
+    hierarchy = hierarchy.sort_values(keys).reset_index(drop=True)
+    for col in merged.columns:
+        if col.startswith("sales_lag_") and col not in df.columns:
+            assert np.allclose(
+                merged[col], hierarchy[col], equal_nan=True, atol=1e-5
+            ), col
+    print("outputs match")
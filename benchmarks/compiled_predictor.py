@@ -0,0 +1,73 @@
+"""Benchmark of the compiled LightGBM predictor against Booster.predict.
+
+A model is trained on synthetic features shaped like the tutorial ones, with
+numerical, categorical and missing values, then the validation rows are
+scored by both. Run from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/compiled_predictor.py --n-rows 200000
+"""
+
+import argparse
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from benchmarks.utils import time_function
+from components.base_images.tutorial.train_model.utils import CompiledPredictor
+
+
+def make_features(n_rows, n_numerical, n_categorical, n_categories, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(
+        rng.normal(size=(n_rows, n_numerical)).astype(np.float32),
+        columns=[f"num_{i}" for i in range(n_numerical)],
+    )
+    # Lag features are missing at the start of the series
+    X.loc[rng.random(n_rows) < 0.1, "num_0"] = np.nan
+    categorical_columns = [f"cat_{i}" for i in range(n_categorical)]
+    for col in categorical_columns:
+        X[col] = pd.Categorical(rng.integers(0, n_categories, n_rows))
+    y = np.abs(
+        np.nan_to_num(X["num_0"])
+        + X["num_1"]
+        + X[categorical_columns[0]].cat.codes % 5
+        + rng.normal(size=n_rows)
+    )
+    return X, y, categorical_columns
+
+
+_parser = argparse.ArgumentParser()
+_parser.add_argument("--n-rows", type=int, default=200000)
+_parser.add_argument("--n-numerical", type=int, default=40)
+_parser.add_argument("--n-categorical", type=int, default=5)
+_parser.add_argument("--n-categories", type=int, default=50)
+_parser.add_argument("--num-boost-round", type=int, default=150)
+_parser.add_argument("--num-threads", type=int, default=1)
+
+if __name__ == "__main__":
+    args = _parser.parse_args()
+    features = (args.n_numerical, args.n_categorical, args.n_categories)
+    X_train, y_train, categorical_columns = make_features(args.n_rows, *features)
+    X_val, _, _ = make_features(args.n_rows, *features, seed=1)
+    model = lgb.train(
+        {"objective": "poisson", "verbose": -1},
+        lgb.Dataset(X_train, y_train),
+        args.num_boost_round,
+    )
+    predictor = CompiledPredictor(model, categorical_columns)
+    print(f"{model.num_trees()} trees, {len(X_val)} rows to score")
+
+    expected, booster_time = time_function(
+        model.predict, X_val, num_threads=args.num_threads
+    )
+    predicted, compiled_time = time_function(
+        predictor.predict, X_val, num_threads=args.num_threads
+    )
+    print(
+        f"Booster.predict: {booster_time:.2f}s, "
+        f"CompiledPredictor.predict: {compiled_time:.2f}s"
+    )
+
+    assert np.allclose(expected, predicted, rtol=1e-9, atol=1e-12), "predictions"
+    print("outputs match")
@@ -0,0 +1,78 @@
+"""Benchmark of join_dimension against the merge-based merge_by_concat helper.
+
+The fact table holds every (store, item, day) of M5, about 59M rows with the
+default arguments, and is joined with a weekly prices table. Run from the root
+of the repository:
+
+    PYTHONPATH=. python benchmarks/join_dimension.py --n-stores 10
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.utils import time_function
+from components.base_images.tutorial.preprocessing.prepare import join_dimension
+
+
+def merge_by_concat(df1, df2, merge_on):
+    """Previous implementation: hash merge of the keys, then concatenation."""
+    merged_df = df1[merge_on]
+    merged_df = merged_df.merge(df2, on=merge_on, how="left")
+    new_columns = [col for col in list(merged_df) if col not in merge_on]
+    df1 = pd.concat([df1, merged_df[new_columns]], axis=1)
+    return df1
+
+
+def make_tables(n_stores, n_items, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    stores = np.array([f"S_{i}" for i in range(n_stores)])
+    items = np.array([f"I_{i}" for i in range(n_items)])
+    weeks = 11101 + np.arange(n_days) // 7
+    n_series = n_stores * n_items
+    fact = pd.DataFrame(
+        {
+            "store_id": pd.Categorical(np.repeat(stores, n_items * n_days)),
+            "item_id": pd.Categorical(np.tile(np.repeat(items, n_days), n_stores)),
+            "wm_yr_wk": np.tile(weeks, n_series).astype(np.int16),
+            "sales": rng.poisson(1.0, n_series * n_days).astype(np.float32),
+        }
+    )
+    unique_weeks = np.unique(weeks)
+    prices = pd.DataFrame(
+        {
+            "store_id": np.repeat(stores, n_items * len(unique_weeks)),
+            "item_id": np.tile(np.repeat(items, len(unique_weeks)), n_stores),
+            "wm_yr_wk": np.tile(unique_weeks, n_series),
+        }
+    )
+    # Items are released at different weeks: drop the first weeks of their prices
+    release = rng.integers(0, len(unique_weeks) // 2, n_series)
+    prices = prices[
+        np.tile(np.arange(len(unique_weeks)), n_series)
+        >= np.repeat(release, len(unique_weeks))
+    ].reset_index(drop=True)
+    prices["sell_price"] = rng.random(len(prices)).astype(np.float32) * 10
+    return fact, prices
+
+
+_parser = argparse.ArgumentParser()
+_parser.add_argument("--n-stores", type=int, default=10)
+_parser.add_argument("--n-items", type=int, default=3049)
+_parser.add_argument("--n-days", type=int, default=1941)
+
+if __name__ == "__main__":
+    args = _parser.parse_args()
+    fact, prices = make_tables(args.n_stores, args.n_items, args.n_days)
+    keys = ["store_id", "item_id", "wm_yr_wk"]
+    print(f"fact: {len(fact)} rows, dimension: {len(prices)} rows")
+
+    merged, merge_time = time_function(merge_by_concat, fact, prices, keys)
+    joined, join_time = time_function(join_dimension, fact, prices, keys)
+    print(f"merge_by_concat: {merge_time:.2f}s, join_dimension: {join_time:.2f}s")
+
+    assert np.allclose(
+        merged["sell_price"], joined["sell_price"], equal_nan=True
+    ), "sell_price"
+    print("outputs match")
@@ -0,0 +1,35 @@
+import time
+from typing import Any, Callable, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def make_sales_data(
+    n_items: int = 3049, n_days: int = 1941, seed: int = 0
+) -> pd.DataFrame:
+    """Builds a long sales table shaped like one M5 store.
+
+    :param n_items: number of items, 3049 per store in M5
+    :param n_days: number of days, 1941 in M5
+    :param seed: random seed
+    :return: dataframe with id columns, date and sales
+    """
+    rng = np.random.default_rng(seed)
+    items = np.repeat(np.arange(n_items), n_days)
+    return pd.DataFrame(
+        {
+            "item_id": pd.Categorical(items.astype(str)),
+            "dept_id": pd.Categorical((items % 7).astype(str)),
+            "cat_id": pd.Categorical((items % 3).astype(str)),
+            "store_id": pd.Categorical(np.full(len(items), "CA_1")),
+            "date": np.tile(pd.date_range("2011-01-29", periods=n_days), n_items),
+            "sales": rng.poisson(1.0, len(items)).astype(np.int16),
+        }
+    )
+
+
+def time_function(function: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
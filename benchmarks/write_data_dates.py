@@ -0,0 +1,125 @@
+"""Benchmark of the month-period date arithmetic of write_data against row-wise apply.
+
+The forecast frame holds one row per article and month since launch, about
+1M rows with the default arguments. Run from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/write_data_dates.py --n-articles 42000
+"""
+
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.utils import time_function
+from components.base_images.tutorial.write_data.utils import (
+    get_fy_forecasts,
+    get_prediction_date,
+)
+
+
+def add_months(row):
+    """Previous implementation: one DateOffset per row."""
+    return row["FirstLaunchDate"] + pd.DateOffset(months=row["MonthSinceLaunch"] - 1)
+
+
+def convert_yearmonth(row):
+    """Previous implementation: one strptime per row."""
+    return datetime.strptime(str(row["YearMonth"]) + "01", "%Y%m%d")
+
+
+def compute_fiscal_year(year, month, after_launch):
+    """Previous implementation, applied with np.vectorize."""
+    if after_launch == 1:
+        if month <= 3:
+            return year - 1
+        else:
+            return year
+    elif after_launch == 0:
+        return year
+    else:
+        raise NotImplementedError()
+
+
+def legacy_get_prediction_date(df, novelties=True):
+    if novelties:
+        return df.assign(
+            FirstLaunchDate=lambda x: pd.to_datetime(x["FirstLaunchDate"])
+        ).assign(PredictionDate=lambda x: x.apply(add_months, axis=1))
+    else:
+        return df.assign(
+            FirstLaunchDate=lambda x: pd.to_datetime(x["FirstLaunchDate"])
+        ).assign(PredictionDate=lambda x: x.apply(convert_yearmonth, axis=1))
+
+
+def legacy_get_fy_forecasts(df, agg_cols):
+    df["FiscalYearLaunch"] = df["FiscalYearLaunch"].astype(int)
+    df["FiscalYearPredictionDate"] = np.vectorize(compute_fiscal_year)(
+        df["PredictionDate"].dt.year,
+        df["PredictionDate"].dt.month,
+        df["AfterLaunch"],
+    )
+    df_grouped = df.loc[df["FiscalYearPredictionDate"] == df["FiscalYearLaunch"], :]
+    return (
+        df_grouped.groupby(agg_cols, as_index=False)
+        .agg({"predicted": sum})
+        .rename(columns={"predicted": "forecasts_fy"})
+    )
+
+
+def make_forecasts(n_articles, n_months, seed=0):
+    rng = np.random.default_rng(seed)
+    launch_dates = pd.Timestamp("2018-01-01") + pd.to_timedelta(
+        rng.integers(0, 1500, n_articles), unit="D"
+    )
+    forecasts = pd.DataFrame(
+        {
+            "Article": np.repeat(np.arange(n_articles), n_months),
+            "FirstLaunchDate": np.repeat(launch_dates.strftime("%Y-%m-%d"), n_months),
+            "MonthSinceLaunch": np.tile(np.arange(1, n_months + 1), n_articles),
+            "AfterLaunch": np.repeat(rng.integers(0, 2, n_articles), n_months),
+            "predicted": rng.random(n_articles * n_months) * 100,
+        }
+    )
+    forecasts["FiscalYearLaunch"] = np.repeat(
+        launch_dates.year - (launch_dates.month <= 3), n_months
+    )
+    month_periods = (
+        (launch_dates.year.to_numpy() * 12 + launch_dates.month.to_numpy() - 1).repeat(
+            n_months
+        )
+        + forecasts["MonthSinceLaunch"].to_numpy()
+        - 1
+    )
+    forecasts["YearMonth"] = (month_periods // 12) * 100 + month_periods % 12 + 1
+    return forecasts
+
+
+_parser = argparse.ArgumentParser()
+_parser.add_argument("--n-articles", type=int, default=42000)
+_parser.add_argument("--n-months", type=int, default=24)
+
+if __name__ == "__main__":
+    args = _parser.parse_args()
+    forecasts = make_forecasts(args.n_articles, args.n_months)
+    print(f"forecasts: {len(forecasts)} rows")
+
+    for novelties in [False, True]:
+        legacy, legacy_time = time_function(
+            legacy_get_prediction_date, forecasts, novelties
+        )
+        dates, dates_time = time_function(get_prediction_date, forecasts, novelties)
+        print(
+            f"get_prediction_date(novelties={novelties}): "
+            f"apply {legacy_time:.2f}s, month periods {dates_time:.2f}s"
+        )
+        assert legacy["PredictionDate"].equals(dates["PredictionDate"]), novelties
+
+    # Fiscal years of the novelties prediction dates, computed last
+    legacy, legacy_time = time_function(legacy_get_fy_forecasts, legacy, ["Article"])
+    fy, fy_time = time_function(get_fy_forecasts, dates, ["Article"])
+    print(f"get_fy_forecasts: vectorize {legacy_time:.2f}s, masks {fy_time:.2f}s")
+
+    pd.testing.assert_frame_equal(legacy, fy)
+    print("outputs match")
@@ -1,6 +1,108 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
 import pandas as pd
 from shap import TreeExplainer
 
+log = logging.getLogger()
+
+SHAP_BACKENDS = ["pred_contrib", "tree_explainer"]
+
+# TreeExplainer of the worker processes, built once per worker
+_WORKER_EXPLAINER = None
+
+
+def sample_per_group(
+    df: pd.DataFrame, group_cols: List[str], n_per_group: int, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Samples at most n rows of each group, e.g. of each article, without groupby.apply.
+
+    :param df: the dataframe to sample
+    :param group_cols: the columns defining the groups
+    :param n_per_group: the maximum number of rows per group, all rows are kept if not set
+    :param seed: the random seed
+    :return: the sampled rows, in their original order
+    """
+    if not n_per_group:
+        return df
+    # Rows are ranked within their group in a random order
+    order = np.random.default_rng(seed).permutation(len(df))
+    groups = df.groupby(group_cols, sort=False, observed=True).ngroup().to_numpy()
+    rank = pd.Series(groups[order]).groupby(groups[order]).cumcount().to_numpy()
+    rows = np.sort(order[rank < n_per_group])
+    log.info(f"Sampled {len(rows)} of {len(df)} rows to explain")
+    return df.iloc[rows]
+
+
+def _init_worker(model) -> None:
+    global _WORKER_EXPLAINER
+    _WORKER_EXPLAINER = TreeExplainer(model)
+
+
+def _explain_batch(batch: pd.DataFrame) -> Tuple[np.ndarray, float]:
+    # The expected value of LightGBM models is only known after an explanation
+    shap_values = _WORKER_EXPLAINER.shap_values(batch)
+    return shap_values, float(np.ravel(_WORKER_EXPLAINER.expected_value)[0])
+
+
+def compute_shap_values(
+    model,
+    explain_df: pd.DataFrame,
+    backend: str = "pred_contrib",
+    batch_size: int = 100000,
+    n_jobs: int = 1,
+) -> Tuple[np.ndarray, float]:
+    """
+    Function to compute the shap values of a LightGBM model batch by batch.
+
+    - pred_contrib: LightGBM native TreeSHAP, multithreaded over the rows
+    - tree_explainer: shap TreeExplainer, batches being explained in a process pool
+
+    :param model: the LightGBM booster
+    :param explain_df: the dataframe of features to explain
+    :param backend: one of `SHAP_BACKENDS`
+    :param batch_size: the number of rows explained at once
+    :param n_jobs: the number of threads or processes, 0 for all the CPUs
+    :return: the shap values, one row per row and one column per feature, and the expected value,
+        NaN if there is no row to explain
+    """
+    if backend not in SHAP_BACKENDS:
+        raise NotImplementedError(f"Unknown shap backend: {backend}")
+    n_jobs = n_jobs or os.cpu_count() or 1
+    batches = [
+        explain_df.iloc[start : start + batch_size]
+        for start in range(0, len(explain_df), batch_size)
+    ]
+    log.info(f"Explaining {len(explain_df)} rows in {len(batches)} batches")
+    if not batches:
+        # The expected value of LightGBM models is only known after an explanation
+        return np.empty((0, explain_df.shape[1])), float("nan")
+
+    if backend == "pred_contrib":
+        # The last column of the contributions is the expected value
+        contributions = np.concatenate(
+            [
+                model.predict(batch, pred_contrib=True, num_threads=n_jobs)
+                for batch in batches
+            ]
+        )
+        return contributions[:, :-1], float(contributions[0, -1])
+
+    # Workers are spawned, LightGBM OpenMP threads do not survive a fork
+    with ProcessPoolExecutor(
+        max_workers=min(n_jobs, len(batches)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model,),
+    ) as executor:
+        results = list(executor.map(_explain_batch, batches))
+    return np.concatenate([values for values, _ in results]), results[0][1]
+
 
 def compute_shap_value_df(
     explainer: TreeExplainer,
@@ -22,44 +124,100 @@ def compute_shap_value_df(
     :param categorical_features: categorical feature names
     """
     shap_values = explainer(explain_df)
-    raw_shap_df = _shap_to_df(shap_values, explain_df, all_ohe_features)
+    return aggregate_shap_values(
+        shap_values.values, explain_df, all_ohe_features, categorical_features
+    )
 
-    scaled_shap_df = (
-        raw_shap_df.pipe(
-            _sum_ohe_shap_values,
-            shap_features=all_ohe_features,
-            categorical_features=categorical_features,
-        )
-        .pipe(_mean_shap_per_article)
-        .pipe(_scale_shap_values)
+
+def aggregate_shap_values(
+    shap_values: np.ndarray,
+    explain_df: pd.DataFrame,
+    all_ohe_features: list,
+    categorical_features: list,
+):
+    """
+    Function to aggregate shap values per article x channel, as `compute_shap_value_df`.
+
+    :param shap_values: the shap values, e.g. from `compute_shap_values`
+    :param explain_df: the dataframe of explained features, indexed by article
+    :param all_ohe_features: one hot encoded feature names
+    :param categorical_features: categorical feature names
+    """
+    abs_shap_values = np.abs(shap_values)
+    raw_shap_df = _shap_to_df(abs_shap_values, explain_df, all_ohe_features)
+
+    # Summed per group first, so that memory scales with the groups
+    groups, mapping = get_shap_groups(all_ohe_features, categorical_features)
+    articles, mean_shap = mean_shap_per_article(
+        abs_shap_values @ mapping, explain_df.index
+    )
+    scaled_shap_df = pd.DataFrame(
+        _scale_shap_values(mean_shap),
+        index=pd.Index(articles, name="Article"),
+        columns=[f"shap_{group}" for group in groups],
     )
     return raw_shap_df, scaled_shap_df
 
 
-def _shap_to_df(shap_values, explain_df, shap_features):
-    return (
-        pd.DataFrame(
-            shap_values.values, columns=[f"shap_{col}" for col in shap_features]
-        )
-        .abs()
-        .assign(Article=explain_df.index)
-    )
+def get_shap_groups(
+    shap_features: list, categorical_features: list
+) -> Tuple[List[str], np.ndarray]:
+    """
+    Function to map features to the groups their shap values are summed in.
+
+    One hot encoded features are grouped by the categorical feature they start
+    with, the other features being groups of their own, first.
+
+    :param shap_features: one hot encoded feature names
+    :param categorical_features: categorical feature names
+    :return: the group names and the features x groups mapping matrix
+    """
+    members = {
+        col: [i for i, x in enumerate(shap_features) if x.startswith(col)]
+        for col in categorical_features
+    }
+    encoded = {i for rows in members.values() for i in rows}
+    ungrouped = [i for i in range(len(shap_features)) if i not in encoded]
+    groups = [shap_features[i] for i in ungrouped] + list(categorical_features)
+
+    mapping = np.zeros((len(shap_features), len(groups)))
+    mapping[ungrouped, np.arange(len(ungrouped))] = 1.0
+    for j, col in enumerate(categorical_features, start=len(ungrouped)):
+        mapping[members[col], j] = 1.0
+    return groups, mapping
+
 
+def mean_shap_per_article(
+    shap_values: np.ndarray, articles: pd.Index
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Function to average shap values per article, as a sorted groupby mean.
 
-def _sum_ohe_shap_values(shap_raw_df, shap_features, categorical_features):
-    for col in categorical_features:
-        ohe_features = [f"shap_{x}" for x in shap_features if x.startswith(col)]
-        shap_raw_df[f"shap_{col}"] = shap_raw_df[ohe_features].sum(axis=1)
-        shap_raw_df = shap_raw_df.drop(columns=ohe_features)
-    return shap_raw_df
+    :param shap_values: the shap values, one row per explained row
+    :param articles: the article of each row, rows without article being ignored
+    :return: the sorted articles and their mean shap values
+    """
+    codes, uniques = pd.factorize(np.asarray(articles), sort=True)
+    keep = np.flatnonzero(codes >= 0)
+    order = keep[np.argsort(codes[keep], kind="stable")]
+    if len(order) == 0:
+        return uniques, np.empty((0, shap_values.shape[1]))
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    sums = np.add.reduceat(shap_values[order], starts, axis=0)
+    counts = np.diff(np.r_[starts, len(order)])
+    return uniques[sorted_codes[starts]], sums / counts[:, None]
 
 
-def _mean_shap_per_article(shap_raw_df):
-    return shap_raw_df.groupby("Article").mean()
+def _shap_to_df(abs_shap_values, explain_df, shap_features):
+    shap_df = pd.DataFrame(
+        abs_shap_values, columns=[f"shap_{col}" for col in shap_features]
+    )
+    shap_df["Article"] = np.asarray(explain_df.index)
+    return shap_df
 
 
-def _scale_shap_values(shap_raw_df):
-    shap_raw_df["shap_sum"] = shap_raw_df.sum(axis=1)
-    for col in shap_raw_df.columns:
-        shap_raw_df[col] = (100 * shap_raw_df[col] / shap_raw_df["shap_sum"]).round(1)
-    return shap_raw_df.drop(columns=["shap_sum"])
+def _scale_shap_values(shap_values: np.ndarray) -> np.ndarray:
+    # Shares of the total in percent, rows without importance being NaN
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.round(100 * shap_values / shap_values.sum(axis=1, keepdims=True), 1)
@@ -0,0 +1,94 @@
+import logging
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from components.base_images.utils.artifacts import (
+    get_artifact_path,
+    read_artifact,
+    write_artifact_part,
+)
+
+log = logging.getLogger()
+
+FEATURE_TABLE_NAME = "features"
+
+
+def get_lookback_days(lags: list, windows: list, shifts: list) -> int:
+    """Calculates how many days of history the lags and rolling means need.
+
+    Parameters
+    ----------
+    lags : List
+        List of lags.
+    windows : List
+        List of window lengths of the rolling means.
+    shifts : List
+        List of offsets of the rolling means.
+
+    Returns
+    -------
+    int
+        Number of days before a date needed to compute its features.
+    """
+    rolling_days = [shift + window - 1 for shift in shifts for window in windows]
+    return max(list(lags) + rolling_days)
+
+
+def get_feature_table_end(
+    folder: str, name: str = FEATURE_TABLE_NAME, date: str = "date"
+) -> Optional[pd.Timestamp]:
+    """Finds the last date of a persisted feature table.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the feature table.
+    name : str
+        Name of the feature table artifact.
+    date : str
+        Name of the date column.
+
+    Returns
+    -------
+    pd.Timestamp
+        Last date of the table, None when there is no table yet.
+    """
+    try:
+        get_artifact_path(folder, name)
+    except FileNotFoundError:
+        return None
+    return pd.Timestamp(read_artifact(folder, name, columns=[date])[date].max())
+
+
+def write_feature_table(
+    df: pd.DataFrame,
+    folder: str,
+    append: bool,
+    name: str = FEATURE_TABLE_NAME,
+    artifact_format: str = "parquet",
+):
+    """Persists features, either as a new table or as a new partition of it.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Features to persist.
+    folder : str
+        Folder of the feature table.
+    append : bool
+        Whether to append the features to the existing table, else the table
+        is replaced.
+    name : str
+        Name of the feature table artifact.
+    artifact_format : str
+        Format of the partition.
+    """
+    table_folder = Path(folder) / name
+    if not append and table_folder.exists():
+        shutil.rmtree(table_folder)
+    part = len(list(table_folder.glob("part-*"))) if table_folder.exists() else 0
+    log.info("Writing %d rows to the feature table, partition %d", len(df), part)
+    write_artifact_part(df, folder, name, part, artifact_format)
@@ -1,6 +1,73 @@
+import numpy as np
 import pandas as pd
 
 
+def _get_group_positions(df: pd.DataFrame, group_by: list):
+    """Locates each row inside its group, for a dataframe sorted by `group_by`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset, sorted by the group columns.
+    group_by : List
+        List of columns defining the groups.
+
+    Returns
+    -------
+    Tuple[np.array, np.array]
+        Position of each row from the start of its group, and size of its group.
+        Rows with a missing group key belong to no group and get a size of 0.
+    """
+    n_rows = len(df)
+    boundaries = np.zeros(n_rows, dtype=bool)
+    missing = np.zeros(n_rows, dtype=bool)
+    for col in group_by:
+        codes, _ = pd.factorize(df[col], sort=False)
+        boundaries[1:] |= codes[1:] != codes[:-1]
+        missing |= codes == -1
+    if n_rows:
+        boundaries[0] = True
+
+    starts = np.flatnonzero(boundaries)
+    sizes = np.diff(np.append(starts, n_rows))
+    offsets = np.arange(n_rows) - np.repeat(starts, sizes)
+    sizes = np.repeat(sizes, sizes)
+    sizes[missing] = 0
+    return offsets, sizes
+
+
+def _shift_block(
+    values: np.array, offsets: np.array, sizes: np.array, lags: list
+) -> np.array:
+    """Shifts a sorted series by several lags at once, without crossing groups.
+
+    Parameters
+    ----------
+    values : np.array
+        Values to shift, sorted by group and date.
+    offsets : np.array
+        Position of each row from the start of its group.
+    sizes : np.array
+        Size of the group of each row.
+    lags : List
+        List of lags to compute (integers, negative values give leads).
+
+    Returns
+    -------
+    np.array
+        Float32 array of shape (len(values), len(lags)), one contiguous column per lag.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    positions = np.arange(len(values))
+    block = np.empty((len(values), len(lags)), dtype=np.float32, order="F")
+    for j, lag in enumerate(lags):
+        valid = (offsets >= lag) & (offsets - lag < sizes)
+        block[:, j] = np.where(
+            valid, values.take(positions - lag, mode="clip"), np.float32(np.nan)
+        )
+    return block
+
+
 def get_lags(
     df: pd.DataFrame,
     lags: list,
@@ -10,6 +77,9 @@ def get_lags(
 ):
     """Calculates the lags features of a given column.
 
+    Group boundaries are located once, then all the lags are built as a single
+    float32 block instead of one groupby per lag.
+
     Parameters
     ----------
     df : pd.DataFrame
@@ -28,9 +98,127 @@ def get_lags(
     pd.DataFrame
         Original dataframe with additional features.
     """
+    lags = list(lags)
     df = df.sort_values(group_by + [date]).reset_index(drop=True)
-    for lag in lags:
-        df[f"{target}_lag_{lag}"] = df.groupby(group_by)[target].shift(lag)
+    offsets, sizes = _get_group_positions(df, group_by)
+    lags_df = pd.DataFrame(
+        _shift_block(
+            df[target].to_numpy(dtype=np.float32, na_value=np.nan), offsets, sizes, lags
+        ),
+        columns=[f"{target}_lag_{lag}" for lag in lags],
+    )
+    df = pd.concat([df.drop(columns=lags_df.columns, errors="ignore"), lags_df], axis=1)
+
+    return df
+
+
+def _get_level_codes(df: pd.DataFrame, columns: list, codes_cache: dict):
+    """Encodes the combination of several columns as integer group codes.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset.
+    columns : List
+        List of columns defining the groups.
+    codes_cache : Dict
+        Codes of the columns already factorized, updated in place.
+
+    Returns
+    -------
+    Tuple[np.array, int]
+        Group code of each row (-1 when a key is missing) and number of groups.
+    """
+    for col in columns:
+        if col not in codes_cache:
+            codes, uniques = pd.factorize(df[col], sort=False)
+            codes_cache[col] = (codes, len(uniques))
+    missing = np.zeros(len(df), dtype=bool)
+    for col in columns:
+        missing |= codes_cache[col][0] == -1
+    codes = np.ravel_multi_index(
+        [np.where(missing, 0, codes_cache[col][0]) for col in columns],
+        [max(codes_cache[col][1], 1) for col in columns],
+    )
+    codes, uniques = pd.factorize(codes, sort=False)
+    codes[missing] = -1
+    return codes, len(uniques)
+
+
+def _group_mean(values: np.array, codes: np.array, n_groups: int) -> np.array:
+    """Averages values by group code, ignoring NaN, and broadcasts the means back.
+
+    Parameters
+    ----------
+    values : np.array
+        Values to average.
+    codes : np.array
+        Group code of each row, -1 for rows belonging to no group.
+    n_groups : int
+        Number of groups.
+
+    Returns
+    -------
+    np.array
+        Float32 mean of the group of each row.
+    """
+    valid = (codes >= 0) & ~np.isnan(values)
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+    counts = np.bincount(codes[valid], minlength=n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = (sums / counts).astype(np.float32)
+    return np.where(codes >= 0, means.take(codes), np.float32(np.nan))
+
+
+def aggregate_lags_hierarchy(
+    df: pd.DataFrame,
+    lags: list,
+    levels: list,
+    target: str = "sales",
+    date: str = "date",
+):
+    """Aggregates lags features already calculated at several hierarchy levels.
+
+    Each level is encoded once as integer group codes with the date, then every
+    lag is averaged with a single bincount and broadcast back by code, without
+    any merge.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset.
+    lags : List
+        List of lags that have already been computed.
+    levels : List
+        Levels at which aggregation is made, each a column name (e.g. "cat_id")
+        or a list of column names (e.g. ["store_id", "dept_id"]).
+    target : str
+        Name of the column to apply the lags on.
+    date : str
+        Name of the date column.
+
+    Returns
+    -------
+    pd.DataFrame
+        Original dataframe with additional features.
+    """
+    codes_cache = {}
+    lag_values = {
+        lag: df[f"{target}_lag_{lag}"].to_numpy(dtype=np.float64, na_value=np.nan)
+        for lag in lags
+    }
+    features = {}
+    for level in levels:
+        level_cols = [level] if isinstance(level, str) else list(level)
+        codes, n_groups = _get_level_codes(df, [date] + level_cols, codes_cache)
+        for lag, values in lag_values.items():
+            features[f"{target}_lag_{lag}_{'_'.join(level_cols)}"] = _group_mean(
+                values, codes, n_groups
+            )
+    features_df = pd.DataFrame(features, index=df.index)
+    df = pd.concat(
+        [df.drop(columns=features_df.columns, errors="ignore"), features_df], axis=1
+    )
 
     return df
 
@@ -62,16 +250,9 @@ def aggregate_lags(
     pd.DataFrame
         Original dataframe with additional features.
     """
-    for lag in lags:
-        group = (
-            df.groupby([date, group_by])[f"{target}_lag_{lag}"]
-            .mean()
-            .to_frame()
-            .rename(columns={f"{target}_lag_{lag}": f"{target}_lag_{lag}_{group_by}"})
-        )
-        df = df.merge(group, left_on=[date, group_by], right_index=True)
-
-    return df
+    return aggregate_lags_hierarchy(
+        df=df, lags=lags, levels=[group_by], target=target, date=date
+    )
 
 
 def get_rolling_means(
@@ -106,3 +287,222 @@ def get_rolling_means(
     df[col_name] = df[cols_avg].mean(axis=1)
 
     return df
+
+
+def _rolling_block(
+    values: np.array,
+    offsets: np.array,
+    sizes: np.array,
+    windows: list,
+    shifts: list,
+    stats: list,
+) -> dict:
+    """Computes rolling statistics on a sorted series, without crossing groups.
+
+    Means and standard deviations come from cumulative sums, so each window is
+    O(n) whatever its length. Minimums, maximums and exponentially weighted
+    means rely on pandas grouped window kernels.
+
+    Parameters
+    ----------
+    values : np.array
+        Values to aggregate, sorted by group and date.
+    offsets : np.array
+        Position of each row from the start of its group.
+    sizes : np.array
+        Size of the group of each row.
+    windows : List
+        List of window lengths.
+    shifts : List
+        List of offsets of the most recent value of the windows.
+    stats : List
+        Statistics among "mean", "std", "min", "max" and "ewm".
+
+    Returns
+    -------
+    Dict
+        Float32 arrays indexed by (stat, window, shift).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_rows = len(values)
+    positions = np.arange(n_rows)
+    group_ids = np.cumsum(offsets == 0) - 1
+    not_null = ~np.isnan(values)
+    # Cumulative sums with a leading 0, so that a window sum is csum[end] - csum[start]
+    csum = np.concatenate([[0.0], np.cumsum(np.where(not_null, values, 0.0))])
+    csum_sq = np.concatenate([[0.0], np.cumsum(np.where(not_null, values**2, 0.0))])
+    ccount = np.concatenate([[0], np.cumsum(not_null)])
+    group_starts = positions - offsets
+    group_ends = group_starts + sizes
+
+    features = {}
+    for shift in shifts:
+        shifted = None
+        for window in windows:
+            # Window covers positions [start, end) clipped to the group bounds
+            end = np.clip(positions - shift + 1, group_starts, group_ends)
+            start = np.clip(positions - shift - window + 1, group_starts, group_ends)
+            count = ccount[end] - ccount[start]
+            total = csum[end] - csum[start]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if "mean" in stats:
+                    features["mean", window, shift] = np.where(
+                        count > 0, total / count, np.nan
+                    ).astype(np.float32)
+                if "std" in stats:
+                    squares = csum_sq[end] - csum_sq[start]
+                    variance = (squares - total**2 / count) / (count - 1)
+                    features["std", window, shift] = np.where(
+                        count > 1, np.sqrt(np.clip(variance, 0, None)), np.nan
+                    ).astype(np.float32)
+
+            kernel_stats = [stat for stat in ["min", "max", "ewm"] if stat in stats]
+            if not kernel_stats:
+                continue
+            if shifted is None:
+                shifted = pd.Series(
+                    _shift_block(values, offsets, sizes, [shift])[:, 0]
+                ).groupby(group_ids, sort=False)
+            for stat in kernel_stats:
+                if stat == "ewm":
+                    result = shifted.ewm(span=window, ignore_na=True).mean()
+                else:
+                    result = getattr(shifted.rolling(window, min_periods=1), stat)()
+                features[stat, window, shift] = result.to_numpy(dtype=np.float32)
+    return features
+
+
+def get_rolling_features(
+    df: pd.DataFrame,
+    windows: list,
+    shifts: list,
+    stats: list = ["mean"],
+    group_by: list = ["item_id"],
+    level: str = None,
+    target: str = "sales",
+    date: str = "date",
+):
+    """Calculates rolling statistics of a column directly from its values.
+
+    The window of length `window` with offset `shift` covers the lags `shift` to
+    `shift + window - 1`, so that `windows=[7], shifts=[14]` gives the same mean
+    as `get_rolling_means` over lags 14 to 20, without materializing the lags.
+    With a `level`, the statistics are computed on the daily mean of the target
+    at this level (e.g. "cat_id") and broadcast back to the rows, which matches
+    averaging the lags aggregated with `aggregate_lags`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset.
+    windows : List
+        List of window lengths.
+    shifts : List
+        List of offsets of the most recent value of the windows.
+    stats : List
+        Statistics to compute among "mean", "std", "min", "max" and "ewm".
+        "ewm" is an exponentially weighted mean with a span equal to the window.
+    group_by : List
+        List of columns defining the series, ignored when `level` is set.
+    level : str
+        Name of the column at which the target is aggregated before rolling.
+    target : str
+        Name of the column to compute the statistics on.
+    date : str
+        Name of the date column.
+
+    Returns
+    -------
+    pd.DataFrame
+        Original dataframe with additional features.
+    """
+    unknown_stats = set(stats) - {"mean", "std", "min", "max", "ewm"}
+    if unknown_stats:
+        raise NotImplementedError(f"Unknown rolling statistics: {unknown_stats}")
+
+    if level is None:
+        df = df.sort_values(group_by + [date]).reset_index(drop=True)
+        series = df
+        rows = None
+        suffix = ""
+    else:
+        series = df.groupby([level, date], observed=True)[target].mean().reset_index()
+        rows = pd.MultiIndex.from_frame(series[[level, date]]).get_indexer(
+            pd.MultiIndex.from_arrays([df[level], df[date]])
+        )
+        group_by = [level]
+        suffix = f"_{level}"
+
+    offsets, sizes = _get_group_positions(series, group_by)
+    features = _rolling_block(
+        series[target].to_numpy(dtype=np.float64, na_value=np.nan),
+        offsets,
+        sizes,
+        list(windows),
+        list(shifts),
+        list(stats),
+    )
+    features_df = pd.DataFrame(
+        {
+            f"{target}_rolling_{stat}_{shift}-{shift + window - 1}{suffix}": (
+                values
+                if rows is None
+                else np.where(rows >= 0, values.take(rows), np.float32(np.nan))
+            )
+            for (stat, window, shift), values in features.items()
+        }
+    )
+    features_df.index = df.index
+    df = pd.concat(
+        [df.drop(columns=features_df.columns, errors="ignore"), features_df], axis=1
+    )
+
+    return df
+
+
+def get_hierarchy_features(
+    df: pd.DataFrame,
+    lags: list,
+    levels: list,
+    windows: list,
+    shifts: list,
+    target: str = "sales",
+    date: str = "date",
+):
+    """Calculates the lags and rolling statistics aggregated at hierarchy levels.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset, with the lags already computed by `get_lags`.
+    lags : List
+        List of lags to aggregate.
+    levels : List
+        List of columns at which aggregation is made.
+    windows : List
+        List of window lengths of the rolling means.
+    shifts : List
+        List of offsets of the rolling means.
+    target : str
+        Name of the target column.
+    date : str
+        Name of the date column.
+
+    Returns
+    -------
+    pd.DataFrame
+        Original dataframe with additional features.
+    """
+    df = aggregate_lags_hierarchy(
+        df=df, lags=lags, levels=levels, target=target, date=date
+    )
+    for level in levels:
+        df = get_rolling_features(
+            df=df,
+            windows=windows,
+            shifts=shifts,
+            level=level,
+            target=target,
+            date=date,
+        )
+    return df
@@ -1,21 +1,94 @@
+import numpy as np
 import pandas as pd
 
+PRICE_STATS = ["diff", "zscore", "rank"]
 
-def get_pricing_features(
+
+def _get_group_codes(df: pd.DataFrame, group_by: list) -> np.array:
+    """Encodes groups as float codes, NaN for rows with a missing key."""
+    codes = df.groupby(group_by, sort=False, observed=True).ngroup().to_numpy()
+    return np.where(codes >= 0, codes, np.nan)
+
+
+def get_relative_price_features(
     df: pd.DataFrame,
-    group_by: list,
+    key_sets: list,
     price_col: str = "sell_price",
+    stats: list = ["diff"],
+    momentum_lags: list = [],
+    series: list = ["item_id", "store_id"],
+    date: str = "date",
 ):
+    """Calculates prices relative to several groups of products in one pass.
+
+    Each key set is encoded once as integer group codes, and the group
+    statistics are broadcast back with `groupby().transform`, without merges.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset.
+    key_sets : List
+        List of lists of columns defining the groups to compare prices with.
+    price_col : str
+        Name of the price column.
+    stats : List
+        Features to compute for each key set among:
+        "diff" (relative difference to the group mean), "zscore" (distance to
+        the group mean in group standard deviations) and "rank" (percentile
+        rank of the price within the group).
+    momentum_lags : List
+        Lags, in days, at which the price is compared with the price of the
+        same series (e.g. 7 for the previous week).
+    series : List
+        List of columns defining a series, used for the momentum.
+    date : str
+        Name of the date column.
+
+    Returns
+    -------
+    pd.DataFrame
+        Original dataframe with additional features.
+    """
+    unknown_stats = set(stats) - set(PRICE_STATS)
+    if unknown_stats:
+        raise NotImplementedError(f"Unknown price statistics: {unknown_stats}")
+
+    prices = df[price_col].astype(np.float32)
+    features = {}
+    for group_by in key_sets:
+        grouped_prices = prices.groupby(_get_group_codes(df, group_by), sort=False)
+        suffix = "_".join(group_by)
+        if "diff" in stats or "zscore" in stats:
+            avg_price = grouped_prices.transform("mean")
+        if "diff" in stats:
+            features[f"{price_col}_diff_{suffix}"] = (prices - avg_price) / avg_price
+        if "zscore" in stats:
+            std_price = grouped_prices.transform("std")
+            features[f"{price_col}_zscore_{suffix}"] = (prices - avg_price) / std_price
+        if "rank" in stats:
+            features[f"{price_col}_rank_{suffix}"] = grouped_prices.rank(pct=True)
 
-    avg_price = (
-        df.groupby(group_by)[price_col]
-        .mean()
-        .reset_index()
-        .rename(columns={price_col: f"avg_{price_col}"})
+    if momentum_lags:
+        series_codes = _get_group_codes(df, series)
+        order = np.lexsort((df[date].to_numpy(), series_codes))
+        sorted_prices = prices.iloc[order].reset_index(drop=True)
+        grouped_sorted_prices = sorted_prices.groupby(series_codes[order], sort=False)
+        for lag in momentum_lags:
+            momentum = np.empty(len(df), dtype=np.float32)
+            momentum[order] = sorted_prices / grouped_sorted_prices.shift(lag) - 1
+            features[f"{price_col}_momentum_{lag}"] = momentum
+
+    features_df = pd.DataFrame(features, index=df.index).astype(np.float32)
+    df = pd.concat(
+        [df.drop(columns=features_df.columns, errors="ignore"), features_df], axis=1
     )
-    df = df.merge(avg_price, how="left", on=group_by)
-    df[f'{price_col}_diff_{"_".join(group_by)}'] = (
-        df[price_col] - df[f"avg_{price_col}"]
-    ) / df[f"avg_{price_col}"]
-    df = df.drop(f"avg_{price_col}", axis=1)
     return df
+
+
+def get_pricing_features(
+    df: pd.DataFrame,
+    group_by: list,
+    price_col: str = "sell_price",
+):
+    return get_relative_price_features(df, [group_by], price_col=price_col)
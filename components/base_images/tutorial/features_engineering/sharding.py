@@ -0,0 +1,171 @@
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from components.base_images.tutorial.features_engineering.lags_and_rolling import (
+    get_lags,
+    get_rolling_features,
+)
+from components.base_images.tutorial.features_engineering.time_features import (
+    get_time_features,
+)
+from components.base_images.utils.artifacts import (
+    read_artifact,
+    write_artifact,
+    write_artifact_part,
+)
+from components.base_images.utils.decorator import timeit
+
+log = logging.getLogger()
+
+
+def get_series_features(
+    df: pd.DataFrame,
+    lags: list,
+    windows: list,
+    shifts: list,
+    series: list = ["store_id", "item_id"],
+    target: str = "sales",
+    date: str = "date",
+):
+    """Calculates the features that only depend on the history of each series.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset, holding whole series.
+    lags : List
+        List of lags to compute.
+    windows : List
+        List of window lengths of the rolling means.
+    shifts : List
+        List of offsets of the rolling means.
+    series : List
+        List of columns defining a series.
+    target : str
+        Name of the target column.
+    date : str
+        Name of the date column.
+
+    Returns
+    -------
+    pd.DataFrame
+        Original dataframe with time, lags and rolling features.
+    """
+    df = get_time_features(df, date=date)
+    df = get_lags(df=df, lags=lags, group_by=series, target=target, date=date)
+    df = get_rolling_features(
+        df=df,
+        windows=windows,
+        shifts=shifts,
+        group_by=series,
+        target=target,
+        date=date,
+    )
+    return df
+
+
+def split_by_series(df: pd.DataFrame, series: list, n_shards: int):
+    """Splits a dataset in shards, each series being entirely in one shard.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset.
+    series : List
+        List of columns defining a series.
+    n_shards : int
+        Number of shards.
+
+    Returns
+    -------
+    Generator[pd.DataFrame]
+        Shards, some of which may be empty when there are few series.
+    """
+    codes = df.groupby(series, sort=False, observed=True).ngroup().to_numpy()
+    shard_ids = np.where(codes >= 0, codes % n_shards, 0)
+    order = np.argsort(shard_ids, kind="stable")
+    bounds = np.cumsum(np.bincount(shard_ids, minlength=n_shards))[:-1]
+    for rows in np.split(order, bounds):
+        yield df.iloc[rows]
+
+
+def _run_shard(
+    function: Callable, shard_folder: Path, part: int, output_folder: Path, kwargs
+) -> None:
+    shard = read_artifact(shard_folder, f"shard-{part:05d}")
+    write_artifact_part(function(shard, **kwargs), output_folder, "features", part)
+
+
+@timeit
+def run_by_series_shards(
+    df: pd.DataFrame,
+    function: Callable,
+    shard_by: list,
+    n_shards: int = 1,
+    n_workers: int = 1,
+    **kwargs,
+):
+    """Applies a per series function to shards of a dataset in a process pool.
+
+    Shards are handed to the workers, and results back, as Parquet files in a
+    temporary folder. With a single shard, the function is applied in process.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset.
+    function : Callable
+        Function taking a dataframe of whole series and returning a dataframe,
+        defined at the top level of a module so that it can be pickled.
+    shard_by : List
+        List of columns defining a series.
+    n_shards : int
+        Number of shards.
+    n_workers : int
+        Number of worker processes, capped by the number of CPUs.
+    kwargs
+        Arguments passed to `function`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Concatenated results of the function on all the shards.
+    """
+    if n_shards <= 1:
+        return function(df, **kwargs)
+
+    n_workers = max(1, min(n_workers, n_shards, os.cpu_count() or 1))
+    log.info(
+        "Running %s on %d shards with %d workers",
+        function.__name__,
+        n_shards,
+        n_workers,
+    )
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        shard_folder = Path(tmp_folder) / "shards"
+        output_folder = Path(tmp_folder) / "output"
+        shard_folder.mkdir()
+        parts = []
+        for part, shard in enumerate(split_by_series(df, shard_by, n_shards)):
+            if len(shard):
+                write_artifact(shard, shard_folder, f"shard-{part:05d}")
+                parts.append(part)
+
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(
+                    _run_shard, function, shard_folder, part, output_folder, kwargs
+                )
+                for part in parts
+            ]
+            for future in futures:
+                future.result()
+
+        return read_artifact(output_folder, "features")
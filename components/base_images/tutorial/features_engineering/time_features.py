@@ -2,33 +2,88 @@ import numpy as np
 import pandas as pd
 
 
-def get_time_features(df, date: str = "date"):
+def build_calendar_features(
+    dates: pd.Series, calendar: pd.DataFrame = None, date: str = "date"
+) -> pd.DataFrame:
+    """Calculates time-related features once per date.
+
+    Parameters
+    ----------
+    dates : pd.Series
+        Unique dates.
+    calendar : pd.DataFrame
+        Optional calendar formatted by `format_calendar_data`, whose columns
+        (events, snap days...) are added to the features.
+    date : str
+        Name of the date column.
+
+    Returns
+    -------
+    pd.DataFrame
+        Calendar dimension, one row per date in the order of `dates`.
+    """
+    dates = pd.Series(pd.to_datetime(dates, format="%Y-%m-%d"), name=date)
+    calendar_df = pd.DataFrame({date: dates.to_numpy()})
+
+    calendar_df["dayofmonth"] = dates.dt.day.to_numpy(dtype=np.int8)
+    calendar_df["week"] = dates.dt.isocalendar().week.to_numpy(dtype=np.int8)
+    calendar_df["month"] = dates.dt.month.to_numpy(dtype=np.int8)
+    calendar_df["year"] = dates.dt.year.to_numpy(dtype=np.int16)
+    calendar_df["dayofweek"] = dates.dt.dayofweek.to_numpy(dtype=np.int8)
+    calendar_df["weekend"] = (calendar_df["dayofweek"] >= 5).astype(np.int8)
+    calendar_df["dayofyear"] = dates.dt.dayofyear.to_numpy(dtype=np.int16)
+    calendar_df["year_month"] = pd.Categorical(
+        calendar_df["year"].astype(str) + "_" + calendar_df["month"].astype(str)
+    )
+
+    if calendar is not None:
+        calendar_df = calendar_df.merge(
+            calendar.drop_duplicates(date), how="left", on=date
+        )
+    return calendar_df
+
+
+def get_time_features(df, date: str = "date", calendar: pd.DataFrame = None):
     """Calculates time-related features.
 
+    The features are computed once per unique date, then joined onto the rows
+    through integer date codes.
+
     Parameters
     ----------
     df : pd.DataFrame
         Dataset.
     date : str
         Name of the date column.
+    calendar : pd.DataFrame
+        Optional calendar formatted by `format_calendar_data`, whose columns
+        missing from the dataset are added as well.
 
     Returns
     -------
     pd.DataFrame
         Original dataframe with additional features.
     """
-    df[date] = pd.to_datetime(df[date], format="%Y-%m-%d")
-
-    df["dayofmonth"] = df[date].dt.day.astype(np.int8)
-    df["week"] = df[date].dt.isocalendar().week.astype(np.int8)
-    df["month"] = df[date].dt.month.astype(np.int8)
-    df["year"] = df[date].dt.year
-    df["dayofweek"] = df[date].dt.dayofweek.astype(np.int8)
-    df["weekend"] = (df["dayofweek"] >= 5).astype(np.int8)
-    df["dayofyear"] = df[date].dt.dayofyear.astype(np.int16)
-
-    df["day_temp"] = 1
-    df["year_month"] = df.year.astype(str) + "_" + df.month.astype(str)
-    df = df.drop("day_temp", axis=1)
+    codes, unique_dates = pd.factorize(df[date], sort=False)
+    if calendar is not None:
+        calendar = calendar[
+            [date] + [col for col in calendar.columns if col not in df.columns]
+        ]
+    calendar_df = build_calendar_features(unique_dates, calendar=calendar, date=date)
 
+    missing = codes == -1
+    allow_fill = bool(missing.any())
+    features_df = pd.DataFrame(
+        {
+            col: pd.api.extensions.take(
+                calendar_df[col].array, codes, allow_fill=allow_fill
+            )
+            for col in calendar_df.columns
+        },
+        index=df.index,
+    )
+    df[date] = features_df.pop(date)
+    df = pd.concat(
+        [df.drop(columns=features_df.columns, errors="ignore"), features_df], axis=1
+    )
     return df
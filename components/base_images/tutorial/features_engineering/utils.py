@@ -1,21 +1,168 @@
+import json
 import logging
-from typing import List
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
 
+import numpy as np
 import pandas as pd
 
+from components.base_images.utils.artifacts import (
+    get_artifact_columns,
+    iter_artifact_rows,
+    read_artifact_rows,
+)
+
 log = logging.getLogger()
 
+SPLITS = ["train", "val", "inference"]
+SPLIT_INDEX_FILE = "split_index.json"
+
 
 def train_test_split(
     df: pd.DataFrame,
     date_col: str,
-    train_start: str,
-    train_end: str,
-    test_start: str,
-    test_end: str,
-) -> List[pd.DataFrame]:
-    train = df.query(f"@train_start <= {date_col} <= @train_end").reset_index(drop=True)
-    log.info(f"Training dataset shape is {train.shape}")
-    test = df.query(f"@test_start <= {date_col} <= @test_end").reset_index(drop=True)
-    log.info(f"Training dataset shape is {test.shape}")
-    return train, test
+    validation_start: str,
+    target: str = "sales",
+) -> Tuple[pd.DataFrame, Dict[str, List[int]]]:
+    """Orders a dataset so that each split is a contiguous range of rows.
+
+    Rows before `validation_start` are in the training split, later rows with
+    a known target in the validation split and rows without target in the
+    inference split. Rows are sorted by split, then by date.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataset.
+    date_col : str
+        Name of the date column.
+    validation_start : str
+        First date of the validation split.
+    target : str
+        Name of the target column.
+
+    Returns
+    -------
+    pd.DataFrame
+        Sorted dataset, with a fresh index.
+    Dict
+        Split index, the [start, stop) row range of each split.
+    """
+    dates = pd.to_datetime(df[date_col]).to_numpy()
+    split_codes = np.where(
+        df[target].isnull().to_numpy(),
+        SPLITS.index("inference"),
+        np.where(
+            dates < np.datetime64(validation_start),
+            SPLITS.index("train"),
+            SPLITS.index("val"),
+        ),
+    )
+    order = np.lexsort((dates, split_codes))
+    bounds = np.concatenate(
+        [[0], np.cumsum(np.bincount(split_codes, minlength=len(SPLITS)))]
+    )
+    split_index = {
+        split: [int(bounds[i]), int(bounds[i + 1])] for i, split in enumerate(SPLITS)
+    }
+    for split, (start, stop) in split_index.items():
+        log.info(f"{split} split has {stop - start} rows")
+    return df.take(order).reset_index(drop=True), split_index
+
+
+def write_split_index(split_index: Dict[str, List[int]], folder: Path) -> None:
+    """Writes the split index next to the dataset.
+
+    Parameters
+    ----------
+    split_index : Dict
+        Split index returned by `train_test_split`.
+    folder : Path
+        Artifact folder.
+    """
+    with open(Path(folder) / SPLIT_INDEX_FILE, "w") as stream:
+        json.dump(split_index, stream)
+
+
+def _get_split_range(folder: Path, split: str) -> List[int]:
+    with open(Path(folder) / SPLIT_INDEX_FILE) as stream:
+        return json.load(stream)[split]
+
+
+def _get_columns(
+    folder: Path, name: str, columns: List[str] = None, exclude: List[str] = None
+) -> List[str]:
+    if not exclude:
+        return columns
+    return [
+        col
+        for col in columns or get_artifact_columns(folder, name)
+        if col not in exclude
+    ]
+
+
+def read_split(
+    folder: Path,
+    split: str,
+    name: str = "features",
+    columns: List[str] = None,
+    exclude: List[str] = None,
+) -> pd.DataFrame:
+    """Reads the rows of one split of a dataset, using its split index.
+
+    Parameters
+    ----------
+    folder : Path
+        Artifact folder, holding the dataset and its split index.
+    split : str
+        One of `SPLITS`.
+    name : str
+        Dataset name.
+    columns : List
+        Columns to read, defaults to all of them.
+    exclude : List
+        Columns not to read.
+
+    Returns
+    -------
+    pd.DataFrame
+        Rows of the split.
+    """
+    start, stop = _get_split_range(folder, split)
+    columns = _get_columns(folder, name, columns, exclude)
+    return read_artifact_rows(folder, name, start, stop, columns=columns)
+
+
+def iter_split(
+    folder: Path,
+    split: str,
+    batch_size: int,
+    name: str = "features",
+    columns: List[str] = None,
+    exclude: List[str] = None,
+) -> Iterator[pd.DataFrame]:
+    """Reads the rows of one split of a dataset batch by batch.
+
+    Parameters
+    ----------
+    folder : Path
+        Artifact folder, holding the dataset and its split index.
+    split : str
+        One of `SPLITS`.
+    batch_size : int
+        Maximum number of rows per batch.
+    name : str
+        Dataset name.
+    columns : List
+        Columns to read, defaults to all of them.
+    exclude : List
+        Columns not to read.
+
+    Returns
+    -------
+    Generator[pd.DataFrame]
+        Batches of rows of the split.
+    """
+    start, stop = _get_split_range(folder, split)
+    columns = _get_columns(folder, name, columns, exclude)
+    return iter_artifact_rows(folder, name, start, stop, batch_size, columns=columns)
@@ -1,53 +1,172 @@
 import numpy as np
 import pandas as pd
 
+from components.base_images.utils.decorator import memit
 
-def reduce_mem_usage(df, verbose=True):
-    numerics = ["int16", "int32", "int64", "float16", "float32", "float64"]
-    start_mem = df.memory_usage().sum() / 1048576
-    for col in df.columns:
-        col_type = df[col].dtypes
-        if str(col_type) in numerics:
-            c_min = df[col].min()
-            c_max = df[col].max()
-            if str(col_type)[:3] == "int":
-                if c_min > np.iinfo(np.int8).min and c_max < np.iinfo(np.int8).max:
-                    df[col] = df[col].astype(np.int8)
-                elif c_min > np.iinfo(np.int16).min and c_max < np.iinfo(np.int16).max:
-                    df[col] = df[col].astype(np.int16)
-                elif c_min > np.iinfo(np.int32).min and c_max < np.iinfo(np.int32).max:
-                    df[col] = df[col].astype(np.int32)
-                elif c_min > np.iinfo(np.int64).min and c_max < np.iinfo(np.int64).max:
-                    df[col] = df[col].astype(np.int64)
-            else:
-                if (
-                    c_min > np.finfo(np.float16).min
-                    and c_max < np.finfo(np.float16).max
-                ):
-                    df[col] = df[col].astype(np.float16)
-                elif (
-                    c_min > np.finfo(np.float32).min
-                    and c_max < np.finfo(np.float32).max
-                ):
-                    df[col] = df[col].astype(np.float32)
-                else:
-                    df[col] = df[col].astype(np.float64)
-    end_mem = df.memory_usage().sum() / 1048576
-    if verbose:
-        print(
-            "Mem. usage decreased to {:5.2f} Mb ({:.1f}% reduction)".format(
-                end_mem, 100 * (start_mem - end_mem) / start_mem
-            )
-        )
+INT_DTYPES = ["int8", "int16", "int32", "int64"]
+UINT_DTYPES = ["uint8", "uint16", "uint32", "uint64"]
+FLOAT_DTYPES = ["float16", "float32", "float64"]
+
+
+def downcast_dtype(dtype, c_min, c_max, float_dtype="float32"):
+    """
+    Finds the smallest dtype of the same kind able to hold a range of values.
+
+    :param dtype: current dtype, numpy or pandas nullable
+    :param c_min: minimum of the values
+    :param c_max: maximum of the values
+    :param float_dtype: smallest float dtype allowed, float32 by default to keep prices precise
+    :return: name of the smallest dtype, or of the current one if it is not numeric
+    """
+    nullable = isinstance(dtype, pd.api.extensions.ExtensionDtype)
+    if pd.isna(c_min) or pd.isna(c_max):
+        if pd.api.types.is_float_dtype(dtype) and not nullable:
+            return float_dtype
+        return str(dtype)
+    if pd.api.types.is_integer_dtype(dtype):
+        candidates = UINT_DTYPES if c_min >= 0 else INT_DTYPES
+        for candidate in candidates:
+            info = np.iinfo(candidate)
+            if info.min <= c_min and c_max <= info.max:
+                return (
+                    candidate.capitalize().replace("Uint", "UInt")
+                    if nullable
+                    else candidate
+                )
+    elif pd.api.types.is_float_dtype(dtype) and not nullable:
+        for candidate in FLOAT_DTYPES[FLOAT_DTYPES.index(float_dtype) :]:
+            info = np.finfo(candidate)
+            if info.min <= c_min and c_max <= info.max:
+                return candidate
+    return str(dtype)
+
+
+def infer_schema(df, float_dtype="float32", category_threshold=0.5):
+    """
+    Infers the smallest dtypes able to hold the values of a dataframe.
+
+    Minimums and maximums of all numeric columns are computed at once, and
+    object columns with few distinct values become categorical.
+
+    :param df: dataframe to scan
+    :param float_dtype: smallest float dtype allowed, float32 by default to keep prices precise
+    :param category_threshold: maximum ratio of distinct values to rows for an object column to become categorical
+    :return: schema, mapping each column to a dtype name, to be applied with `apply_schema`
+    """
+    schema = {col: str(dtype) for col, dtype in df.dtypes.items()}
+    numerics = df.select_dtypes(include="number").select_dtypes(exclude="bool")
+    mins, maxs = numerics.min(), numerics.max()
+    for col in numerics.columns:
+        schema[col] = downcast_dtype(df[col].dtype, mins[col], maxs[col], float_dtype)
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        if df[col].nunique() <= category_threshold * len(df):
+            schema[col] = "category"
+    return schema
+
+
+@memit
+def apply_schema(df, schema):
+    """
+    Casts the columns of a dataframe to the dtypes of a schema, without scanning it.
+
+    The schema should come from `infer_schema` on data covering the range of
+    the values of `df`: integers out of range would overflow.
+
+    :param df: dataframe to cast, modified in place
+    :param schema: schema returned by `infer_schema`
+    :return: the casted dataframe
+    """
+    for col, dtype in schema.items():
+        if col in df.columns and str(df[col].dtype) != dtype:
+            df[col] = df[col].astype(dtype)
     return df
 
 
-def merge_by_concat(df1, df2, merge_on):
-    merged_df = df1[merge_on]
-    merged_df = merged_df.merge(df2, on=merge_on, how="left")
-    new_columns = [col for col in list(merged_df) if col not in merge_on]
-    df1 = pd.concat([df1, merged_df[new_columns]], axis=1)
-    return df1
+def reduce_mem_usage(df, schema=None, float_dtype="float32", category_threshold=0.5):
+    if schema is None:
+        schema = infer_schema(df, float_dtype, category_threshold)
+    return apply_schema(df, schema)
+
+
+def _encode_keys(fact, dim, keys):
+    """
+    Encodes composite keys of both tables as int64 codes in the same code space.
+
+    :param fact: large table
+    :param dim: small table
+    :param keys: key columns, present in both tables
+    :return: codes of the fact rows and of the dimension rows, -1 for missing keys
+    """
+    fact_codes = np.zeros(len(fact), dtype=np.int64)
+    dim_codes = np.zeros(len(dim), dtype=np.int64)
+    fact_missing = np.zeros(len(fact), dtype=bool)
+    dim_missing = np.zeros(len(dim), dtype=bool)
+    stride = 1
+    for col in keys:
+        codes, uniques = pd.factorize(dim[col], sort=False)
+        uniques = pd.Index(uniques)
+        if isinstance(fact[col].dtype, pd.CategoricalDtype):
+            # Look up the categories only, then broadcast with the category codes,
+            # the trailing -1 being taken for missing values
+            category_codes = uniques.get_indexer(fact[col].cat.categories)
+            fact_col_codes = np.append(category_codes, -1).take(fact[col].cat.codes)
+        else:
+            fact_col_codes = uniques.get_indexer(fact[col])
+        fact_missing |= fact_col_codes == -1
+        dim_missing |= codes == -1
+        fact_codes += fact_col_codes * stride
+        dim_codes += codes * stride
+        stride *= max(len(uniques), 1)
+        if stride >= np.iinfo(np.int64).max // 2:
+            raise ValueError(f"Too many distinct keys to encode {keys} as int64")
+    fact_codes[fact_missing] = -1
+    dim_codes[dim_missing] = -1
+    return fact_codes, dim_codes
+
+
+def join_dimension(fact, dim, on, columns=None):
+    """
+    Left joins a small dimension table onto a large fact table.
+
+    Composite keys are encoded as single int64 codes, the dimension is sorted
+    by code once and each fact row finds its dimension row by binary search.
+    Dimension columns are then gathered with a take, keeping their dtypes
+    (categoricals included), without building an intermediate merged frame.
+
+    :param fact: large table, e.g. the melted sales
+    :param dim: small table with unique keys, e.g. the calendar or the prices
+    :param on: key columns, present in both tables
+    :param columns: dimension columns to add, defaults to all non key columns
+    :return: fact table with the dimension columns appended, NaN where no key matches
+    """
+    if columns is None:
+        columns = [col for col in dim.columns if col not in on]
+    fact_codes, dim_codes = _encode_keys(fact, dim, on)
+
+    order = np.argsort(dim_codes, kind="stable")
+    sorted_codes = dim_codes[order]
+    valid = sorted_codes >= 0
+    order, sorted_codes = order[valid], sorted_codes[valid]
+    if np.any(sorted_codes[1:] == sorted_codes[:-1]):
+        raise ValueError(f"Dimension keys {on} are not unique")
+
+    positions = np.searchsorted(sorted_codes, fact_codes).clip(
+        0, max(len(sorted_codes) - 1, 0)
+    )
+    rows = -np.ones(len(fact), dtype=np.int64)
+    if len(sorted_codes):
+        matched = (fact_codes >= 0) & (sorted_codes[positions] == fact_codes)
+        rows[matched] = order[positions[matched]]
+    allow_fill = bool((rows == -1).any())
+
+    dim_df = pd.DataFrame(
+        {
+            col: pd.api.extensions.take(dim[col].array, rows, allow_fill=allow_fill)
+            for col in columns
+        },
+        index=fact.index,
+    )
+    return pd.concat([fact, dim_df], axis=1)
 
 
 def format_calendar_data(calendar):
@@ -68,44 +187,138 @@ def format_calendar_data(calendar):
     return calendar
 
 
+def get_day_columns(sales):
+    return [col for col in sales.columns if col.startswith("d_")]
+
+
 def melt_sales_data(sales, id_cols):
-    sales = sales.melt(id_vars=id_cols, var_name="date", value_name="sales")
+    sales = sales.melt(
+        id_vars=id_cols,
+        value_vars=get_day_columns(sales),
+        var_name="date",
+        value_name="sales",
+    )
     return sales
 
 
-def reduce_memory(sales, id_cols):
+def reduce_memory(sales, id_cols, schema=None):
     for col in id_cols:
         sales[col] = sales[col].astype("category")
-    sales = reduce_mem_usage(sales)
+    sales = reduce_mem_usage(sales, schema)
     return sales
 
 
+def infer_melted_sales_schema(sales, id_cols, float_dtype="float32"):
+    """
+    Infers the schema of the melted sales from the wide table, without melting it.
+
+    :param sales: wide sales table, one row per series and one column per day
+    :param id_cols: id columns of the series
+    :param float_dtype: smallest float dtype allowed
+    :return: schema of the melted sales
+    """
+    days = sales[get_day_columns(sales)]
+    dtype = days.dtypes.iloc[0] if days.dtypes.nunique() == 1 else np.dtype("float64")
+    schema = {col: "category" for col in id_cols + ["date"]}
+    schema["sales"] = downcast_dtype(
+        dtype, days.min().min(), days.max().max(), float_dtype
+    )
+    return schema
+
+
 def create_release_date_column(sales, prices):
     release_df = (
-        prices.groupby(["store_id", "item_id"])["wm_yr_wk"].agg(["min"]).reset_index()
+        prices.groupby(["store_id", "item_id"], observed=True)["wm_yr_wk"]
+        .agg(["min"])
+        .reset_index()
     )
     release_df.columns = ["store_id", "item_id", "release"]
-    sales = merge_by_concat(sales, release_df, ["store_id", "item_id"])
+    sales = join_dimension(sales, release_df, ["store_id", "item_id"])
     return sales
 
 
 def merge_sales_calendar(sales, calendar):
     sales = sales.rename(columns={"date": "d"})
-    sales = merge_by_concat(sales, calendar, ["d"])
+    sales = join_dimension(sales, calendar, ["d"])
     return sales
 
 
-def filter_out_sales_before_release_date(sales):
+def filter_out_sales_before_release_date(sales, release_origin=None):
     # Filter out rows for which date < item release date (not "real zeros")
     sales = sales[sales["wm_yr_wk"] >= sales["release"]]
     sales = sales.reset_index(drop=True)
-    # Normalize release column
-    sales["release"] = sales["release"] - sales["release"].min()
+    # Normalize release column, against a common origin when processing chunks
+    if release_origin is None:
+        release_origin = sales["release"].min()
+    sales["release"] = sales["release"] - release_origin
     sales["release"] = sales["release"].astype(np.int16)
     return sales
 
 
 def merge_sales_prices(sales, prices):
-    sales = merge_by_concat(sales, prices, ["store_id", "item_id", "wm_yr_wk"])
+    sales = join_dimension(sales, prices, ["store_id", "item_id", "wm_yr_wk"])
     sales = sales.drop(["d"], axis=1)
     return sales
+
+
+def iter_sales_chunks(sales, chunk_by=None, max_rows_per_chunk=None):
+    """
+    Splits the wide sales table into chunks of series.
+
+    :param sales: wide sales table, one row per series and one column per day
+    :param chunk_by: column whose values each give a chunk (e.g. "store_id"), optional
+    :param max_rows_per_chunk: maximum number of rows of a chunk once melted, optional
+    :return: generator of chunks
+    """
+    groups = (
+        [group for _, group in sales.groupby(chunk_by, sort=True, observed=True)]
+        if chunk_by
+        else [sales]
+    )
+    series_per_chunk = len(sales)
+    if max_rows_per_chunk:
+        series_per_chunk = max(
+            1, max_rows_per_chunk // max(len(get_day_columns(sales)), 1)
+        )
+    for group in groups:
+        for start in range(0, len(group), series_per_chunk):
+            yield group.iloc[start : start + series_per_chunk]
+
+
+def prepare_sales_by_chunks(
+    sales, prices, calendar, id_cols, chunk_by=None, max_rows_per_chunk=None
+):
+    """
+    Prepares the sales chunk by chunk so that only one chunk is melted at a time.
+
+    Each chunk is melted, downcasted, merged with the calendar and the prices and
+    filtered from the release date of its items. Id columns share the same
+    categories in all chunks, and the dtypes of the melted sales are inferred
+    once from the wide table.
+
+    :param sales: wide sales table, one row per series and one column per day
+    :param prices: prices table
+    :param calendar: calendar formatted by `format_calendar_data`
+    :param id_cols: id columns of the series
+    :param chunk_by: column whose values each give a chunk (e.g. "store_id"), optional
+    :param max_rows_per_chunk: maximum number of rows of a chunk once melted, optional
+    :return: generator of prepared chunks
+    """
+    sales = sales.copy()
+    for col in id_cols:
+        sales[col] = sales[col].astype("category")
+    series_keys = ["store_id", "item_id"]
+    prices = prices.merge(sales[series_keys].drop_duplicates(), on=series_keys)
+    release_origin = prices.groupby(series_keys, observed=True)["wm_yr_wk"].min().min()
+    schema = infer_melted_sales_schema(sales, id_cols)
+
+    for chunk in iter_sales_chunks(sales, chunk_by, max_rows_per_chunk):
+        chunk_prices = prices.merge(chunk[series_keys], on=series_keys)
+        yield (
+            chunk.pipe(melt_sales_data, id_cols)
+            .pipe(reduce_memory, id_cols, schema=schema)
+            .pipe(create_release_date_column, prices=chunk_prices)
+            .pipe(merge_sales_calendar, calendar=calendar)
+            .pipe(filter_out_sales_before_release_date, release_origin=release_origin)
+            .pipe(merge_sales_prices, prices=chunk_prices)
+        )
@@ -0,0 +1,165 @@
+import ctypes
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+log = logging.getLogger()
+
+# Walks flattened LightGBM trees, following the decision rules of LightGBM's
+# Tree::NumericalDecision and Tree::CategoricalDecision. Leaves are nodes
+# pointing to themselves. Rows are walked by blocks, tree by tree, so that a
+# tree stays in cache while it is walked for the rows of a block.
+TREE_WALKER_SOURCE = r"""
+#include <math.h>
+#include <stdint.h>
+
+#define BLOCK 64
+
+static inline int32_t step(
+    const double* x, int32_t node,
+    const int32_t* feature, const double* threshold, const uint8_t* flags,
+    const int32_t* left, const int32_t* right,
+    const int32_t* cat_index, const uint8_t* cat_table, int64_t cat_width
+) {
+    /* flags: bit 0 categorical, bit 1 default left, bits 2-3 missing type */
+    uint8_t flag = flags[node];
+    double value = x[feature[node]];
+    int go_left;
+    if (flag & 1) {
+        /* Missing, negative and unseen categories go right */
+        if (isnan(value) || value < 0 || value >= (double)cat_width) {
+            go_left = 0;
+        } else {
+            go_left = cat_table[(int64_t)cat_index[node] * cat_width + (int64_t)value];
+        }
+    } else {
+        int missing = flag >> 2;
+        if (isnan(value) && missing != 2) {
+            value = 0.0;
+        }
+        if ((missing == 1 && fabs(value) <= 1e-35) || (missing == 2 && isnan(value))) {
+            go_left = (flag >> 1) & 1;
+        } else {
+            go_left = value <= threshold[node];
+        }
+    }
+    return go_left ? left[node] : right[node];
+}
+
+void predict_raw(
+    const double* X, int64_t n_rows, int64_t n_features,
+    const int32_t* roots, int64_t n_trees,
+    const int32_t* feature, const double* threshold, const uint8_t* flags,
+    const int32_t* left, const int32_t* right,
+    const int32_t* cat_index, const uint8_t* cat_table, int64_t cat_width,
+    const double* values, double* out, int num_threads
+) {
+    int64_t n_blocks = (n_rows + BLOCK - 1) / BLOCK;
+    #pragma omp parallel for num_threads(num_threads) schedule(static)
+    for (int64_t b = 0; b < n_blocks; ++b) {
+        int64_t first = b * BLOCK;
+        int64_t size = n_rows - first < BLOCK ? n_rows - first : BLOCK;
+        double sums[BLOCK] = {0.0};
+        for (int64_t t = 0; t < n_trees; ++t) {
+            for (int64_t r = 0; r < size; ++r) {
+                int32_t node = roots[t];
+                while (left[node] != node) {
+                    node = step(
+                        X + (first + r) * n_features, node, feature, threshold, flags,
+                        left, right, cat_index, cat_table, cat_width
+                    );
+                }
+                sums[r] += values[node];
+            }
+        }
+        for (int64_t r = 0; r < size; ++r) {
+            out[first + r] = sums[r];
+        }
+    }
+}
+"""
+
+_LIBRARY = None
+_BUILD_FAILED = False
+
+
+def _build(path: Path) -> None:
+    # Sources and libraries have per-process names, so that processes building
+    # at the same time never compile a file being written by another one
+    source = path.with_name(f".{path.stem}.{os.getpid()}.c")
+    source.write_text(TREE_WALKER_SOURCE)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    compiler = os.environ.get("CC", "cc")
+    flags = ["-O3", "-shared", "-fPIC"]
+    try:
+        try:
+            subprocess.run(
+                [compiler, *flags, "-fopenmp", str(source), "-o", str(tmp_path)],
+                check=True,
+                capture_output=True,
+            )
+        except subprocess.CalledProcessError:
+            # Compilers without OpenMP build a single-threaded walker
+            subprocess.run(
+                [compiler, *flags, str(source), "-o", str(tmp_path)],
+                check=True,
+                capture_output=True,
+            )
+        tmp_path.replace(path)
+    finally:
+        source.unlink()
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def get_tree_walker() -> Optional[ctypes.CDLL]:
+    """
+    Builds the native tree walker once per machine and loads it once per process.
+
+    :return: the loaded library, None when it cannot be built, e.g. without C compiler
+    """
+    global _LIBRARY, _BUILD_FAILED
+    if _LIBRARY is not None or _BUILD_FAILED:
+        return _LIBRARY
+
+    digest = hashlib.md5(TREE_WALKER_SOURCE.encode()).hexdigest()[:12]
+    path = Path(tempfile.gettempdir()) / f"tree_walker_{digest}.so"
+    try:
+        if not path.exists():
+            _build(path)
+        library = ctypes.CDLL(str(path))
+    except (OSError, subprocess.CalledProcessError) as error:
+        log.warning(f"Native tree walker unavailable, using NumPy: {error}")
+        _BUILD_FAILED = True
+        return None
+
+    int32_array = np.ctypeslib.ndpointer(np.int32, flags="C_CONTIGUOUS")
+    float64_array = np.ctypeslib.ndpointer(np.float64, flags="C_CONTIGUOUS")
+    uint8_array = np.ctypeslib.ndpointer(np.uint8, flags="C_CONTIGUOUS")
+    library.predict_raw.restype = None
+    library.predict_raw.argtypes = [
+        float64_array,
+        ctypes.c_int64,
+        ctypes.c_int64,
+        int32_array,
+        ctypes.c_int64,
+        int32_array,
+        float64_array,
+        uint8_array,
+        int32_array,
+        int32_array,
+        int32_array,
+        uint8_array,
+        ctypes.c_int64,
+        float64_array,
+        float64_array,
+        ctypes.c_int,
+    ]
+    _LIBRARY = library
+    return _LIBRARY
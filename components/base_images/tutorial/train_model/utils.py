@@ -1,7 +1,49 @@
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import List, Tuple
 
 import joblib
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from components.base_images.tutorial.train_model.tree_walker import get_tree_walker
+from components.base_images.utils.storage import file_md5
+
+log = logging.getLogger()
+
+TRAIN_DATASET_FILE = "train.bin"
+VALID_DATASET_FILE = "valid.bin"
+PANDAS_CATEGORICAL_FILE = "pandas_categorical.json"
+CATEGORICAL_COLUMNS_FILE = "categorical_columns.json"
+MODEL_FILE = "lgb.pkl"
+COMPILED_MODEL_FILE = "lgb_compiled.pkl"
+
+# Output transformations of the supported objectives, applied to the raw scores
+_OBJECTIVE_TRANSFORMS = {
+    **dict.fromkeys(
+        ["regression", "regression_l1", "huber", "fair", "quantile", "mape"],
+        lambda raw: raw,
+    ),
+    **dict.fromkeys(["poisson", "gamma", "tweedie"], np.exp),
+    **dict.fromkeys(
+        ["binary", "cross_entropy"], lambda raw: 1.0 / (1.0 + np.exp(-raw))
+    ),
+}
+_MISSING_TYPES = {"None": 0, "Zero": 1, "NaN": 2}
+_ZERO_THRESHOLD = 1e-35
+
+
+def _json_default(obj):
+    # numpy scalars of the categories, stored as LightGBM does in its model files
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
 
 
 def _get_timestamp_str():
@@ -20,4 +62,428 @@ def log_models(model_artifact, model, framework) -> dict:
 
     model_folder = Path(model_artifact.path)
     model_folder.mkdir(parents=True, exist_ok=True)
-    joblib.dump(model, model_folder / "lgb.pkl")
+    joblib.dump(model, model_folder / MODEL_FILE)
+
+
+class CompiledPredictor:
+    """
+    LightGBM model compiled to flat NumPy arrays, predicting without the booster.
+
+    The trees are flattened into arrays of nodes, leaves being nodes pointing
+    to themselves, walked by a native library or level by level for all the
+    rows and trees at once with NumPy. The features are read in a fixed order
+    and the categorical ones are encoded once with the training categories,
+    as LightGBM does for pandas input.
+    """
+
+    def __init__(self, model: lgb.Booster, categorical_columns: List[str]):
+        """
+        Compiles a trained model, at its best iteration.
+
+        :param model: trained model
+        :param categorical_columns: categorical columns of the training data, in their order
+        """
+        dump = model.dump_model()
+        objective = dump["objective"].split(" ")[0]
+        if objective not in _OBJECTIVE_TRANSFORMS:
+            raise NotImplementedError(f"Objective {objective} cannot be compiled")
+        if dump["num_tree_per_iteration"] != 1 or dump["average_output"]:
+            raise NotImplementedError(
+                "Only single output boosted models can be compiled"
+            )
+        self.objective = objective
+        self.model_md5 = None
+        self.feature_names = dump["feature_names"]
+        self.categories = dict(
+            zip(categorical_columns, dump.get("pandas_categorical") or [])
+        )
+
+        nodes, cat_sets, roots = [], [], []
+        for tree in dump["tree_info"]:
+            roots.append(len(nodes))
+            self._add_node(tree["tree_structure"], nodes, cat_sets)
+        self.roots = np.array(roots, dtype=np.int32)
+        columns = list(zip(*nodes)) if nodes else [[]] * 9
+        self.feature = np.array(columns[0], dtype=np.int32)
+        self.threshold = np.array(columns[1], dtype=np.float64)
+        self.is_categorical = np.array(columns[2], dtype=bool)
+        self.default_left = np.array(columns[3], dtype=bool)
+        self.missing_type = np.array(columns[4], dtype=np.uint8)
+        self.left = np.array(columns[5], dtype=np.int32)
+        self.right = np.array(columns[6], dtype=np.int32)
+        self.cat_index = np.array(columns[7], dtype=np.int32)
+        self.values = np.array(columns[8], dtype=np.float64)
+        self.is_leaf = self.left == np.arange(len(nodes))
+        # Decision flags packed in a byte for the native tree walker
+        self.flags = (
+            self.is_categorical
+            | (self.default_left.astype(np.uint8) << 1)
+            | (self.missing_type << 2)
+        ).astype(np.uint8)
+        width = max([max(cats) + 1 for cats in cat_sets if cats] + [1])
+        self.cat_table = np.zeros((max(len(cat_sets), 1), width), dtype=np.uint8)
+        for i, cats in enumerate(cat_sets):
+            self.cat_table[i, cats] = 1
+
+    @classmethod
+    def _add_node(cls, node: dict, nodes: list, cat_sets: list) -> None:
+        # Adds a subtree in depth-first order, the left child following its parent
+        index = len(nodes)
+        if "leaf_value" in node:
+            nodes.append((0, 0.0, False, False, 0, index, index, 0, node["leaf_value"]))
+            return
+        nodes.append(None)
+        is_categorical = node["decision_type"] == "=="
+        cat_index = 0
+        if is_categorical:
+            cat_index = len(cat_sets)
+            cat_sets.append([int(cat) for cat in str(node["threshold"]).split("||")])
+        cls._add_node(node["left_child"], nodes, cat_sets)
+        right = len(nodes)
+        cls._add_node(node["right_child"], nodes, cat_sets)
+        nodes[index] = (
+            node["split_feature"],
+            0.0 if is_categorical else node["threshold"],
+            is_categorical,
+            node["default_left"],
+            _MISSING_TYPES[node["missing_type"]],
+            index + 1,
+            right,
+            cat_index,
+            0.0,
+        )
+
+    def to_matrix(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        Encodes features as a float64 matrix in the order of the model features.
+
+        :param X: features, with at least the model features
+        :return: matrix, categories being replaced by their training codes
+        """
+        matrix = np.empty((len(X), len(self.feature_names)), dtype=np.float64)
+        for i, col in enumerate(self.feature_names):
+            if col in self.categories:
+                codes = pd.Categorical(X[col], categories=self.categories[col]).codes
+                matrix[:, i] = np.where(codes >= 0, codes, np.nan)
+            else:
+                matrix[:, i] = X[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        return matrix
+
+    def _go_left(self, node: np.ndarray, values: np.ndarray) -> np.ndarray:
+        missing_type = self.missing_type[node]
+        is_nan = np.isnan(values)
+        values = np.where(is_nan & (missing_type != _MISSING_TYPES["NaN"]), 0.0, values)
+        is_missing = (
+            (missing_type == _MISSING_TYPES["Zero"])
+            & (np.abs(values) <= _ZERO_THRESHOLD)
+        ) | ((missing_type == _MISSING_TYPES["NaN"]) & is_nan)
+        numerical = np.where(
+            is_missing, self.default_left[node], values <= self.threshold[node]
+        )
+
+        # Categories are looked up in a table of the categories going left,
+        # missing and negative values going right
+        width = self.cat_table.shape[1]
+        codes = np.where(is_nan, -1.0, np.clip(values, -1.0, width)).astype(np.int64)
+        in_table = (codes >= 0) & (codes < width)
+        categorical = in_table & self.cat_table[
+            self.cat_index[node], codes.clip(0, width - 1)
+        ].astype(bool)
+        return np.where(self.is_categorical[node], categorical, numerical)
+
+    def predict_raw(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        Computes the raw scores, the sums of the leaf values of the trees.
+
+        :param matrix: features encoded by `to_matrix`
+        :return: raw scores
+        """
+        n_rows, n_trees = len(matrix), len(self.roots)
+        row = np.repeat(np.arange(n_rows), n_trees)
+        node = np.tile(self.roots, n_rows)
+        active = np.flatnonzero(~self.is_leaf[node])
+        while len(active):
+            current = node[active]
+            go_left = self._go_left(current, matrix[row[active], self.feature[current]])
+            node[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[~self.is_leaf[node[active]]]
+        return self.values[node].reshape(n_rows, n_trees).sum(axis=1)
+
+    def predict_raw_native(self, matrix: np.ndarray, num_threads: int = 0):
+        """
+        Computes the raw scores with the native tree walker.
+
+        :param matrix: features encoded by `to_matrix`
+        :param num_threads: number of threads, 0 for all the CPUs
+        :return: raw scores, None when the native tree walker is unavailable
+        """
+        walker = get_tree_walker()
+        if walker is None:
+            return None
+        out = np.empty(len(matrix), dtype=np.float64)
+        walker.predict_raw(
+            np.ascontiguousarray(matrix),
+            len(matrix),
+            matrix.shape[1],
+            self.roots,
+            len(self.roots),
+            self.feature,
+            self.threshold,
+            self.flags,
+            self.left,
+            self.right,
+            self.cat_index,
+            self.cat_table,
+            self.cat_table.shape[1],
+            self.values,
+            out,
+            num_threads or os.cpu_count() or 1,
+        )
+        return out
+
+    def predict(
+        self, X: pd.DataFrame, num_threads: int = 0, batch_size: int = None
+    ) -> np.ndarray:
+        """
+        Predicts the rows of a dataframe, as `Booster.predict` does.
+
+        The trees are walked by a native library built on first use, else by
+        the NumPy implementation.
+
+        :param X: features, with at least the model features
+        :param num_threads: number of threads, 0 for all the CPUs
+        :param batch_size: number of rows evaluated at once by NumPy, defaults to
+            about 4M row-tree pairs
+        :return: predictions
+        """
+        matrix = self.to_matrix(X)
+        raw = self.predict_raw_native(matrix, num_threads)
+        if raw is None:
+            batch_size = batch_size or max(1, (1 << 22) // max(len(self.roots), 1))
+            batches = [
+                matrix[start : start + batch_size]
+                for start in range(0, len(matrix), batch_size)
+            ]
+            if num_threads != 1 and len(batches) > 1:
+                with ThreadPoolExecutor(max_workers=num_threads or None) as executor:
+                    raw = list(executor.map(self.predict_raw, batches))
+            else:
+                raw = [self.predict_raw(batch) for batch in batches]
+            raw = np.concatenate(raw) if raw else np.empty(0)
+        return _OBJECTIVE_TRANSFORMS[self.objective](raw)
+
+
+def log_compiled_model(model_artifact, model: lgb.Booster, categorical_columns):
+    """
+    Compiles a model and saves it next to the model, for the scoring components.
+
+    :param model_artifact: Location folder for the model, saved by `log_models`
+    :param model: the trained model
+    :param categorical_columns: categorical columns of the training data, in their order
+    """
+    model_folder = Path(model_artifact.path)
+    predictor = CompiledPredictor(model, categorical_columns)
+    # Checksum of the saved model, to detect a compiled model left from another one
+    predictor.model_md5 = file_md5(model_folder / MODEL_FILE)
+    joblib.dump(predictor, model_folder / COMPILED_MODEL_FILE)
+    model_artifact.metadata["compiled"] = True
+
+
+def load_model(model_folder: Path):
+    """
+    Loads the model of a model artifact, its compiled version when there is one.
+
+    :param model_folder: Location folder for the model
+    :return: `CompiledPredictor` or booster, both having a `predict` method
+    """
+    model_folder = Path(model_folder)
+    if (model_folder / COMPILED_MODEL_FILE).exists():
+        predictor = joblib.load(model_folder / COMPILED_MODEL_FILE)
+        if predictor.model_md5 == file_md5(model_folder / MODEL_FILE):
+            return predictor
+        log.warning("Compiled model does not match the model, ignoring it")
+    return joblib.load(model_folder / MODEL_FILE)
+
+
+def sanitize_column_names(X: pd.DataFrame) -> pd.DataFrame:
+    """
+    Removes the characters LightGBM does not accept in feature names.
+
+    :param X: features
+    :return: features with sanitized column names
+    """
+    return X.rename(columns=lambda x: re.sub("[^A-Za-z0-9_]+", "", x))
+
+
+def prepare_features(X: pd.DataFrame, categorical_columns: List[str]) -> pd.DataFrame:
+    """
+    Prepares features the same way for training, evaluation and inference.
+
+    :param X: features
+    :param categorical_columns: columns to make categorical, when present
+    :return: features with categorical columns and sanitized column names
+    """
+    for col in categorical_columns:
+        if col in X.columns:
+            X[col] = pd.Categorical(X[col])
+    return sanitize_column_names(X)
+
+
+def save_datasets(
+    X_train: pd.DataFrame,
+    y_train: np.ndarray,
+    X_val: pd.DataFrame,
+    y_val: np.ndarray,
+    folder: Path,
+    params: dict = None,
+) -> None:
+    """
+    Bins the training and validation data once and saves them as LightGBM binary files.
+
+    The category lists of the pandas categorical columns are not part of the
+    binary format, they are saved next to it.
+
+    :param X_train: training features, prepared with `prepare_features`
+    :param y_train: training target
+    :param X_val: validation features, prepared with `prepare_features`
+    :param y_val: validation target
+    :param folder: output folder
+    :param params: LightGBM dataset parameters, e.g. max_bin
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    train_data = lgb.Dataset(X_train, y_train, params=params, free_raw_data=True)
+    valid_data = lgb.Dataset(X_val, y_val, reference=train_data, free_raw_data=True)
+    train_data.save_binary(str(folder / TRAIN_DATASET_FILE))
+    valid_data.save_binary(str(folder / VALID_DATASET_FILE))
+    with open(folder / PANDAS_CATEGORICAL_FILE, "w") as stream:
+        json.dump(train_data.pandas_categorical, stream, default=_json_default)
+    with open(folder / CATEGORICAL_COLUMNS_FILE, "w") as stream:
+        json.dump(list(X_train.select_dtypes("category").columns), stream)
+
+
+def load_datasets(folder: Path, params: dict = None) -> Tuple[lgb.Dataset, lgb.Dataset]:
+    """
+    Loads the datasets saved by `save_datasets`, without binning them again.
+
+    :param folder: folder of the datasets
+    :param params: LightGBM dataset parameters, the ones used to save them
+    :return: training and validation datasets
+    """
+    folder = Path(folder)
+    train_data = lgb.Dataset(str(folder / TRAIN_DATASET_FILE), params=params)
+    with open(folder / PANDAS_CATEGORICAL_FILE) as stream:
+        train_data.pandas_categorical = json.load(stream)
+    valid_data = lgb.Dataset(str(folder / VALID_DATASET_FILE), reference=train_data)
+    return train_data, valid_data
+
+
+def load_categorical_columns(folder: Path) -> List[str]:
+    """
+    Loads the names of the categorical columns of the datasets saved by `save_datasets`.
+
+    :param folder: folder of the datasets
+    :return: categorical columns, in the order of `pandas_categorical`
+    """
+    with open(Path(folder) / CATEGORICAL_COLUMNS_FILE) as stream:
+        return json.load(stream)
+
+
+def get_sweep_name(overrides: dict) -> str:
+    """
+    Names a configuration of a sweep.
+
+    :param overrides: parameters overriding the base parameters, with an optional name
+    :return: the name, else the overridden values joined by underscores
+    """
+    if "name" in overrides:
+        return overrides["name"]
+    return "_".join(str(value) for value in overrides.values()) or "base"
+
+
+def train_sweep(
+    dataset_folder: Path,
+    params: dict,
+    sweep: List[dict],
+    n_workers: int = 1,
+    dataset_params: dict = None,
+    num_threads: int = None,
+    **train_kwargs,
+) -> List[dict]:
+    """
+    Trains one model per configuration of a sweep, in a single process.
+
+    The thread budget is split between the models trained concurrently. Sequential
+    sweeps share the same loaded datasets, concurrent ones load a copy each
+    since a LightGBM dataset is bound to the booster training on it.
+
+    :param dataset_folder: folder of the datasets saved by `save_datasets`
+    :param params: base LightGBM parameters
+    :param sweep: parameters overriding the base ones, one dict per configuration
+    :param n_workers: number of models trained concurrently
+    :param dataset_params: LightGBM dataset parameters, the ones used to save them
+    :param num_threads: total number of threads, e.g. the CPU limit of the container,
+        defaults to `n_jobs` of the parameters when positive, else to the CPU count
+    :param train_kwargs: arguments passed to `lgb.train`
+    :return: name, parameters, model, best iteration and best score of each configuration
+    """
+    n_workers = max(1, min(n_workers, len(sweep)))
+    if not num_threads:
+        n_jobs = params.get("n_jobs") or 0
+        num_threads = n_jobs if n_jobs > 0 else os.cpu_count() or 1
+    num_threads = max(1, num_threads // n_workers)
+    shared_datasets = (
+        load_datasets(dataset_folder, params=dataset_params) if n_workers == 1 else None
+    )
+
+    def train(overrides: dict) -> dict:
+        train_params = {**params, **overrides, "num_threads": num_threads}
+        train_params.pop("name", None)
+        train_params.pop("n_jobs", None)
+        train_data, valid_data = shared_datasets or load_datasets(
+            dataset_folder, params=dataset_params
+        )
+        model = lgb.train(
+            train_params, train_data, valid_sets=[valid_data], **train_kwargs
+        )
+        return {
+            "name": get_sweep_name(overrides),
+            "params": train_params,
+            "model": model,
+            "best_iteration": model.best_iteration,
+            "best_score": {
+                metric: float(score)
+                for metric, score in model.best_score["valid_0"].items()
+            },
+        }
+
+    log.info(
+        f"Training {len(sweep)} models, {n_workers} at a time with {num_threads} threads"
+    )
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(train, sweep))
+
+
+def log_sweep_models(
+    model_artifact, results: List[dict], metric: str, framework
+) -> dict:
+    """
+    Saves the models of a sweep, the best one being saved as the artifact model.
+
+    :param model_artifact: Location folder for the models, one subfolder per configuration
+    :param results: results of `train_sweep`
+    :param metric: validation metric to minimize
+    :param framework: framework of the models
+    :return: the result of the best configuration
+    """
+    model_folder = Path(model_artifact.path)
+    for result in results:
+        (model_folder / result["name"]).mkdir(parents=True, exist_ok=True)
+        joblib.dump(result["model"], model_folder / result["name"] / MODEL_FILE)
+    best = min(results, key=lambda result: result["best_score"][metric])
+    log_models(model_artifact, best["model"], framework)
+    model_artifact.metadata["best_configuration"] = best["name"]
+    model_artifact.metadata["sweep"] = {
+        result["name"]: result["best_score"][metric] for result in results
+    }
+    return best
@@ -0,0 +1,98 @@
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from components.base_images.utils.artifacts import write_artifact_part
+
+log = logging.getLogger()
+
+
+def score_batches(
+    model,
+    batches: Iterable[pd.DataFrame],
+    output_folder: Path,
+    name: str = "inference",
+    prepare: Callable[[pd.DataFrame], pd.DataFrame] = None,
+    num_threads: int = 0,
+    prediction_col: str = "sales_pred",
+    artifact_format: str = "parquet",
+    key_columns: List[str] = None,
+) -> dict:
+    """Predicts batches of rows and writes each batch as a partition.
+
+    Only one batch is held in memory at a time, so memory does not grow
+    with the number of rows to score.
+
+    Parameters
+    ----------
+    model : lgb.Booster
+        Trained model.
+    batches : Iterable[pd.DataFrame]
+        Batches of features, e.g. from `iter_split`.
+    output_folder : Path
+        Folder of the predictions.
+    name : str
+        Name of the partitioned predictions artifact.
+    prepare : Callable
+        Function preparing the features of a batch before prediction.
+    num_threads : int
+        Number of threads used by LightGBM to predict a batch, 0 for its default.
+    prediction_col : str
+        Name of the predictions column.
+    artifact_format : str
+        Format of the partitions.
+    key_columns : List
+        Columns written with the predictions but not used as features, e.g.
+        the date the predictions are partitioned by downstream.
+
+    Returns
+    -------
+    Dict
+        Scoring statistics: numbers of rows and batches, rows per second and
+        batch latencies in seconds, reading and writing included.
+    """
+    output_folder = Path(output_folder)
+    latencies, n_rows = [], 0
+    start = batch_start = time.perf_counter()
+    key_columns = key_columns or []
+    for part, batch in enumerate(batches):
+        keys = batch[key_columns]
+        batch = batch.drop(columns=key_columns)
+        if prepare is not None:
+            batch = prepare(batch)
+        batch[prediction_col] = np.asarray(
+            model.predict(batch, num_threads=num_threads)
+        )
+        if key_columns:
+            batch = pd.concat([keys, batch], axis=1)
+        write_artifact_part(batch, output_folder, name, part, artifact_format)
+        latencies.append(time.perf_counter() - batch_start)
+        n_rows += len(batch)
+        log.info(
+            f"Batch {part}: {len(batch)} rows scored in {latencies[-1]:.3f}s, "
+            f"{len(batch) / max(latencies[-1], 1e-9):.0f} rows/s"
+        )
+        batch_start = time.perf_counter()
+    if not latencies:
+        # Keep an empty artifact for the next components
+        write_artifact_part(
+            pd.DataFrame({prediction_col: []}), output_folder, name, 0, artifact_format
+        )
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "rows": n_rows,
+        "batches": len(latencies),
+        "rows_per_sec": n_rows / max(elapsed, 1e-9),
+        "mean_batch_latency": float(np.mean(latencies)) if latencies else 0.0,
+        "p95_batch_latency": float(np.percentile(latencies, 95)) if latencies else 0.0,
+    }
+    log.info(
+        f"Scored {n_rows} rows in {len(latencies)} batches, "
+        f"{stats['rows_per_sec']:.0f} rows/s"
+    )
+    return stats
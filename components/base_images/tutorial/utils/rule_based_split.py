@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def apply_rule_based_monthly_split(
     forecasts_df,
     train_df,
@@ -5,58 +8,96 @@ def apply_rule_based_monthly_split(
     column_to_compute_split,
     month_launch_to_apply="all",
 ):
-    ratios = train_df.copy()
-    ratios = ratios[ratios.FiscalYear >= train_fiscal_year_range[0]]
-    ratios = ratios[ratios.FiscalYear <= train_fiscal_year_range[1]]
+    return apply_rule_based_monthly_splits(
+        forecasts_df,
+        train_df,
+        [train_fiscal_year_range],
+        column_to_compute_split,
+        month_launch_to_apply,
+    )[tuple(train_fiscal_year_range)]
+
+
+def apply_rule_based_monthly_splits(
+    forecasts_df,
+    train_df,
+    train_fiscal_year_ranges,
+    column_to_compute_split,
+    month_launch_to_apply="all",
+):
+    """
+    Splits the forecasts of each article x channel over the months since launch.
+
+    The monthly split coefficients are learnt on the training quantities of
+    each fiscal year range, the forecast totals being computed once for all
+    the ranges.
+
+    :param forecasts_df: the monthly forecasts, in a predicted column
+    :param train_df: the training quantities
+    :param train_fiscal_year_ranges: the first and last fiscal years of each split
+    :param column_to_compute_split: the column the split coefficients are computed by
+    :param month_launch_to_apply: the launch months to split, "all" for every month
+    :return: the split forecasts, by fiscal year range
+    """
+    forecasts_df = forecasts_df.reset_index(drop=True)
+    total_per_channel = _sum_per_group(
+        forecasts_df, ["Article", "Channel"], "predicted"
+    )
+    if month_launch_to_apply == "all":
+        to_apply = np.ones(len(forecasts_df), dtype=bool)
+    else:
+        to_apply = forecasts_df["MonthLaunch"].isin(month_launch_to_apply).to_numpy()
+
+    keys = [column_to_compute_split, "Channel", "MonthSinceLaunch"]
+    split_forecasts = {}
+    for fiscal_year_range in train_fiscal_year_ranges:
+        ratios = compute_monthly_coefficients(
+            train_df, fiscal_year_range, column_to_compute_split
+        )
+        coefficient = (
+            forecasts_df[keys]
+            .merge(ratios[keys + ["Coefficient"]], how="left", on=keys)["Coefficient"]
+            .to_numpy()
+        )
+        split_df = forecasts_df.copy()
+        if to_apply.any():
+            split_df["predicted"] = np.where(
+                to_apply, coefficient * total_per_channel, split_df["predicted"]
+            )
+        split_forecasts[tuple(fiscal_year_range)] = split_df
+    return split_forecasts
+
+
+def compute_monthly_coefficients(
+    train_df, train_fiscal_year_range, column_to_compute_split
+):
+    """
+    Computes the share of the quantities of each month since launch.
+
+    :param train_df: the training quantities
+    :param train_fiscal_year_range: the first and last fiscal years to learn from
+    :param column_to_compute_split: the column the split coefficients are computed by
+    :return: the coefficients, by column_to_compute_split x channel x month since launch
+    """
+    ratios = train_df[
+        (train_df.FiscalYear >= train_fiscal_year_range[0])
+        & (train_df.FiscalYear <= train_fiscal_year_range[1])
+    ]
     ratios = (
         ratios.groupby([column_to_compute_split, "Channel", "MonthSinceLaunch"])
         .agg({"Quantities": "sum"})
         .reset_index()
         .rename(columns={"Quantities": "total_per_month"})
     )
-    ratios_total = (
-        ratios.groupby([column_to_compute_split, "Channel"])
-        .agg({"total_per_month": "sum"})
-        .reset_index()
-        .rename(columns={"total_per_month": "total"})
-    )
-    ratios = ratios.merge(
-        ratios_total, on=[column_to_compute_split, "Channel"], how="left"
-    )
+    ratios["total"] = ratios.groupby([column_to_compute_split, "Channel"])[
+        "total_per_month"
+    ].transform("sum")
     ratios["Coefficient"] = ratios["total_per_month"] / ratios["total"]
+    return ratios
 
-    forecasts_modified_df = forecasts_df.copy()
-    total_per_channel = (
-        forecasts_modified_df.groupby(["Article", "Channel"])
-        .agg({"predicted": "sum"})
-        .reset_index()
-        .rename(columns={"predicted": "total_per_channel"})
-    )
-
-    forecasts_modified_df = forecasts_modified_df.merge(
-        total_per_channel, on=["Article", "Channel"], how="left"
-    )
 
-    forecasts_modified_df = forecasts_modified_df.merge(
-        ratios[[column_to_compute_split, "Channel", "MonthSinceLaunch", "Coefficient"]],
-        how="left",
-        on=[column_to_compute_split, "Channel", "MonthSinceLaunch"],
-    )
-
-    forecasts_modified_df["predicted"] = forecasts_modified_df.apply(
-        _compute_rule_based_predictions, args=(month_launch_to_apply,), axis=1
-    )
-    forecasts_modified_df = forecasts_modified_df.drop(
-        columns=["Coefficient", "total_per_channel"]
-    )
-
-    return forecasts_modified_df
-
-
-def _compute_rule_based_predictions(row, month_launch_to_apply):
-    if month_launch_to_apply == "all":
-        return row["Coefficient"] * row["total_per_channel"]
-    elif row["MonthLaunch"] in month_launch_to_apply:
-        return row["Coefficient"] * row["total_per_channel"]
-    else:
-        return row["predicted"]
+def _sum_per_group(df, group_cols, value_col):
+    # Group sums broadcast to the rows, NaN for the rows with a missing key
+    groups = df.groupby(group_cols, sort=False, observed=True)
+    sums = groups[value_col].sum().to_numpy(dtype=np.float64)
+    codes = groups.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    return np.append(sums, np.nan)[codes]
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+
+def to_month_periods(dates: pd.Series) -> np.ndarray:
+    """Converts dates to month periods, the number of months since 1970-01.
+
+    Parameters
+    ----------
+    dates : pd.Series
+        Dates.
+
+    Returns
+    -------
+    np.ndarray
+        Month periods, as datetime64[M].
+    """
+    return pd.to_datetime(dates).to_numpy().astype("datetime64[M]")
+
+
+def add_months_since_launch(
+    launch_dates: pd.Series, months_since_launch: pd.Series
+) -> pd.Series:
+    """Computes the date of each month since launch, the launch being month 1.
+
+    Same as adding `pd.DateOffset(months=months_since_launch - 1)` to each
+    date: the day of month is kept, clipped to the last day of the month, and
+    so is the time of day.
+
+    Parameters
+    ----------
+    launch_dates : pd.Series
+        Launch dates.
+    months_since_launch : pd.Series
+        Months since launch, starting at 1.
+
+    Returns
+    -------
+    pd.Series
+        Dates of the months since launch.
+    """
+    launch_dates = pd.to_datetime(launch_dates)
+    offsets = np.asarray(months_since_launch, dtype=np.int64) - 1
+    months = to_month_periods(launch_dates) + offsets.astype("timedelta64[M]")
+    month_starts = months.astype("datetime64[D]")
+    month_lengths = (months + 1).astype("datetime64[D]") - month_starts
+    days = np.minimum(
+        launch_dates.dt.day.to_numpy(dtype=np.float64) - 1,
+        month_lengths.astype(np.float64) - 1,
+    )
+    time_of_day = (launch_dates - launch_dates.dt.normalize()).to_numpy()
+    return pd.Series(
+        month_starts.astype("datetime64[ns]")
+        + np.nan_to_num(days).astype("timedelta64[D]")
+        + time_of_day,
+        index=launch_dates.index,
+    )
+
+
+def parse_year_month(year_month: pd.Series) -> pd.Series:
+    """Parses YYYYMM integers, or strings, as the first day of their month.
+
+    Parameters
+    ----------
+    year_month : pd.Series
+        Months, e.g. 202103.
+
+    Returns
+    -------
+    pd.Series
+        First days of the months.
+    """
+    values = pd.to_numeric(year_month).to_numpy(dtype=np.int64)
+    years, months = values // 100, values % 100
+    invalid = (months < 1) | (months > 12)
+    if invalid.any():
+        raise ValueError(f"Invalid year months: {values[invalid][:10]}")
+    periods = (years - 1970) * 12 + months - 1
+    return pd.Series(
+        periods.astype("datetime64[M]").astype("datetime64[ns]"),
+        index=year_month.index,
+    )
+
+
+def compute_fiscal_years(
+    years: np.ndarray, months: np.ndarray, after_launch: np.ndarray
+) -> np.ndarray:
+    """Computes fiscal years, starting in April for the months after launch.
+
+    Parameters
+    ----------
+    years : np.ndarray
+        Calendar years.
+    months : np.ndarray
+        Calendar months.
+    after_launch : np.ndarray
+        1 when fiscal years start in April, 0 when they are calendar years.
+
+    Returns
+    -------
+    np.ndarray
+        Fiscal years.
+    """
+    years, months = np.asarray(years), np.asarray(months)
+    after_launch = np.asarray(after_launch)
+    if not np.isin(after_launch, [0, 1]).all():
+        raise NotImplementedError()
+    return years - ((after_launch == 1) & (months <= 3))
@@ -1,35 +1,32 @@
-from datetime import datetime
-
 import numpy as np
 import pandas as pd
 
-
-def add_months(row):
-    return row["FirstLaunchDate"] + pd.DateOffset(months=row["MonthSinceLaunch"] - 1)
-
-
-def convert_yearmonth(row):
-    return datetime.strptime(str(row["YearMonth"]) + "01", "%Y%m%d")
+from components.base_images.tutorial.write_data.dates import (
+    add_months_since_launch,
+    compute_fiscal_years,
+    parse_year_month,
+)
 
 
 def get_prediction_date(df, novelties=True):
+    df = df.assign(FirstLaunchDate=lambda x: pd.to_datetime(x["FirstLaunchDate"]))
     if novelties:
         return df.assign(
-            FirstLaunchDate=lambda x: pd.to_datetime(x["FirstLaunchDate"])
-        ).assign(PredictionDate=lambda x: x.apply(add_months, axis=1))
+            PredictionDate=lambda x: add_months_since_launch(
+                x["FirstLaunchDate"], x["MonthSinceLaunch"]
+            )
+        )
     else:
-        return df.assign(
-            FirstLaunchDate=lambda x: pd.to_datetime(x["FirstLaunchDate"])
-        ).assign(PredictionDate=lambda x: x.apply(convert_yearmonth, axis=1))
+        return df.assign(PredictionDate=lambda x: parse_year_month(x["YearMonth"]))
 
 
 def get_fy_forecasts(df, agg_cols, novelties=True):
     df["FiscalYearLaunch"] = df["FiscalYearLaunch"].astype(int)
     if novelties:
-        df["FiscalYearPredictionDate"] = np.vectorize(compute_fiscal_year)(
-            df["PredictionDate"].dt.year,
-            df["PredictionDate"].dt.month,
-            df["AfterLaunch"],
+        df["FiscalYearPredictionDate"] = compute_fiscal_years(
+            df["PredictionDate"].dt.year.to_numpy(),
+            df["PredictionDate"].dt.month.to_numpy(),
+            df["AfterLaunch"].to_numpy(),
         )
         df_grouped = df.loc[df["FiscalYearPredictionDate"] == df["FiscalYearLaunch"], :]
     else:
@@ -49,18 +46,6 @@ def get_yearly_forecasts(df, inference_agg_cols):
     )
 
 
-def compute_fiscal_year(year, month, after_launch):
-    if after_launch == 1:
-        if month <= 3:
-            return year - 1
-        else:
-            return year
-    elif after_launch == 0:
-        return year
-    else:
-        raise NotImplementedError()
-
-
 def pivot_shap(df):
     return (
         df.set_index(["Category", "Article", "Channel"])
@@ -72,8 +57,7 @@ def pivot_shap(df):
 
 
 def process_shap_values(df, config):
-    for feature_name, feature_list in config["features_to_add"].items():
-        df = add_features(df, feature_name, feature_list)
+    df = add_feature_groups(df, config["features_to_add"])
 
     df = rename_features(df, config).sort_values(
         ["Article", "Channel", "feature_importance"], ascending=False
@@ -82,18 +66,54 @@ def process_shap_values(df, config):
 
 
 def add_features(df, feature_name, feature_list):
-    feature_df = df[df.features.isin(feature_list)]
-    feature_df = (
-        feature_df.groupby(["Category", "Article", "Channel"])
-        .agg({"feature_importance": "sum"})
-        .reset_index()
-    )
-    feature_df["features"] = feature_name
-    other_features_df = df[~df.features.isin(feature_list)]
-    df = pd.concat([other_features_df, feature_df]).sort_values(
+    return add_feature_groups(df, {feature_name: feature_list})
+
+
+def add_feature_groups(df, features_to_add):
+    """
+    Sums the importances of lists of features into new features, in one pass.
+
+    Gives the same result as calling `add_features` for each list in order: a
+    list may hold a feature added by a previous one. Each row is assigned to
+    its last group first, then concatenated and sorted once.
+
+    :param df: the feature importances, one row per feature
+    :param features_to_add: the features to sum, by new feature name
+    :return: the feature importances with the new features
+    """
+    if not features_to_add:
+        return df
+
+    # Resolves the feature of each row to the last list absorbing it
+    labels = pd.unique(df["features"])
+    names = np.array(labels, dtype=object)
+    stages = np.full(len(labels), -1)
+    added_features = list(features_to_add)
+    for stage, (feature_name, feature_list) in enumerate(features_to_add.items()):
+        absorbed = pd.Index(names).isin(feature_list)
+        names[absorbed] = feature_name
+        stages[absorbed] = stage
+    row_stages = stages[pd.Index(labels).get_indexer(df["features"])]
+
+    feature_dfs = []
+    for stage, feature_name in enumerate(added_features):
+        # New features absorbed by a later list are not part of the result
+        if any(
+            feature_name in features_to_add[later]
+            for later in added_features[stage + 1 :]
+        ):
+            continue
+        feature_df = (
+            df[row_stages == stage]
+            .groupby(["Category", "Article", "Channel"])
+            .agg({"feature_importance": "sum"})
+            .reset_index()
+        )
+        feature_df["features"] = feature_name
+        feature_dfs.append(feature_df)
+    return pd.concat([df[row_stages < 0], *feature_dfs]).sort_values(
         ["Category", "Channel", "Article"]
     )
-    return df
 
 
 def rename_features(df, config):
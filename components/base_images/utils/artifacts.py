@@ -0,0 +1,410 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd  # type: ignore
+import pyarrow as pa  # type: ignore
+import pyarrow.parquet as pq  # type: ignore
+
+from components.base_images.utils.decorator import shapeit, timeit
+
+log = logging.getLogger()
+
+DEFAULT_ARTIFACT_FORMAT = "parquet"
+
+# Parquet has no half-precision type and only keeps string categoricals: such
+# columns are widened on write and restored on read thanks to this schema
+# metadata entry.
+_DTYPES_METADATA_KEY = b"artifact_dtypes"
+
+# Rows per Parquet row group, the unit skipped by filters and row range reads
+PARQUET_ROW_GROUP_SIZE = 1 << 20
+
+Reader = Callable[..., pd.DataFrame]
+Writer = Callable[[pd.DataFrame, Path], None]
+
+
+def _write_parquet(df: pd.DataFrame, path: Path) -> None:
+    restored = {
+        col: str(dtype)
+        for col, dtype in df.dtypes.items()
+        if dtype == "float16" or isinstance(dtype, pd.CategoricalDtype)
+    }
+    widened = [col for col, dtype in restored.items() if dtype == "float16"]
+    if widened:
+        df = df.astype({col: "float32" for col in widened})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_DTYPES_METADATA_KEY] = json.dumps(restored).encode()
+    table = table.replace_schema_metadata(metadata)
+    pq.write_table(
+        table,
+        path,
+        row_group_size=PARQUET_ROW_GROUP_SIZE,
+        use_dictionary=True,
+        compression="snappy",
+    )
+
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    df = table.to_pandas()
+    metadata = table.schema.metadata or {}
+    restored = json.loads(metadata.get(_DTYPES_METADATA_KEY, b"{}"))
+    restored = {
+        col: dtype
+        for col, dtype in restored.items()
+        if col in df.columns and str(df[col].dtype) != dtype
+    }
+    if restored:
+        df = df.astype(restored)
+    return df
+
+
+def _read_parquet(
+    path: Path, columns: Optional[List[str]] = None, filters: Optional[List] = None
+) -> pd.DataFrame:
+    return _to_pandas(pq.read_table(path, columns=columns, filters=filters))
+
+
+def _read_parquet_rows(
+    path: Path, start: int, stop: int, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    row_groups, offset, first_row = [], 0, None
+    for i in range(parquet_file.num_row_groups):
+        num_rows = parquet_file.metadata.row_group(i).num_rows
+        if offset < stop and offset + num_rows > start:
+            row_groups.append(i)
+            first_row = offset if first_row is None else first_row
+        offset += num_rows
+    if not row_groups:
+        table = parquet_file.schema_arrow.empty_table()
+        return _to_pandas(table.select(columns) if columns else table)
+    table = parquet_file.read_row_groups(row_groups, columns=columns)
+    return _to_pandas(table.slice(start - first_row, stop - start))
+
+
+def _iter_parquet_rows(
+    path: Path,
+    start: int,
+    stop: int,
+    batch_size: int,
+    columns: Optional[List[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    offset = 0
+    for i in range(parquet_file.num_row_groups):
+        num_rows = parquet_file.metadata.row_group(i).num_rows
+        first, last = max(start, offset), min(stop, offset + num_rows)
+        if first < last:
+            table = parquet_file.read_row_group(i, columns=columns)
+            for batch_start in range(first, last, batch_size):
+                length = min(batch_size, last - batch_start)
+                yield _to_pandas(table.slice(batch_start - offset, length))
+        offset += num_rows
+
+
+def _write_csv(df: pd.DataFrame, path: Path) -> None:
+    df.to_csv(path, index=False)
+
+
+def _read_csv(
+    path: Path, columns: Optional[List[str]] = None, filters: Optional[List] = None
+) -> pd.DataFrame:
+    if filters:
+        raise NotImplementedError("Row filters are only supported by parquet artifacts")
+    return pd.read_csv(path, usecols=columns)
+
+
+def _iter_csv_rows(
+    path: Path,
+    start: int,
+    stop: int,
+    batch_size: int,
+    columns: Optional[List[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    yield from pd.read_csv(
+        path,
+        usecols=columns,
+        skiprows=range(1, start + 1),
+        nrows=stop - start,
+        chunksize=batch_size,
+    )
+
+
+def _read_csv_rows(
+    path: Path, start: int, stop: int, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    return pd.read_csv(
+        path, usecols=columns, skiprows=range(1, start + 1), nrows=stop - start
+    )
+
+
+ARTIFACT_FORMATS: Dict[str, Tuple[Reader, Writer]] = {
+    "parquet": (_read_parquet, _write_parquet),
+    "csv": (_read_csv, _write_csv),
+}
+
+# Readers of a range of rows, the other formats are read in full then sliced
+_ROW_RANGE_READERS: Dict[str, Callable[..., pd.DataFrame]] = {
+    "parquet": _read_parquet_rows,
+    "csv": _read_csv_rows,
+}
+_ROW_BATCH_READERS: Dict[str, Callable[..., Iterator[pd.DataFrame]]] = {
+    "parquet": _iter_parquet_rows,
+    "csv": _iter_csv_rows,
+}
+
+
+def register_artifact_format(name: str, reader: Reader, writer: Writer) -> None:
+    """
+    Registers a new artifact format.
+
+    :param name: format name, also used as the file extension
+    :param reader: function reading a file into a dataframe, with an optional `columns`
+        argument and, to support row filters, an optional `filters` argument
+    :param writer: function writing a dataframe to a file
+    """
+    ARTIFACT_FORMATS[name] = (reader, writer)
+
+
+def get_artifact_path(folder: Path, name: str) -> Path:
+    """
+    Finds the file holding a dataset artifact, whatever its format.
+
+    :param folder: artifact folder
+    :param name: dataset name, without extension
+    :return: path to the existing file, or to the folder of a partitioned artifact
+    """
+    folder = Path(folder)
+    for artifact_format in ARTIFACT_FORMATS:
+        path = folder / f"{name}.{artifact_format}"
+        if path.exists():
+            return path
+    if (folder / name).is_dir():
+        return folder / name
+    raise FileNotFoundError(f"No artifact named {name} in {folder}")
+
+
+def _concat_parts(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates partitions, keeping categorical columns categorical."""
+    if len(parts) == 1:
+        return parts[0]
+    for col, dtype in parts[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories = pd.api.types.union_categoricals(
+                [part[col] for part in parts], ignore_order=True
+            ).categories
+            for part in parts:
+                part[col] = part[col].cat.set_categories(categories)
+    return pd.concat(parts, ignore_index=True)
+
+
+@timeit
+@shapeit
+def write_artifact(
+    df: pd.DataFrame,
+    folder: Path,
+    name: str,
+    artifact_format: str = DEFAULT_ARTIFACT_FORMAT,
+) -> Path:
+    """
+    Writes a dataset artifact passed between components.
+
+    The dataframe index is not persisted: reset it beforehand if it holds data.
+
+    :param df: dataframe to write
+    :param folder: artifact folder
+    :param name: dataset name, without extension
+    :param artifact_format: one of `ARTIFACT_FORMATS`, defaults to parquet
+    :return: path of the written file
+    """
+    if artifact_format not in ARTIFACT_FORMATS:
+        raise NotImplementedError(f"Unknown artifact format: {artifact_format}")
+    _, writer = ARTIFACT_FORMATS[artifact_format]
+    path = Path(folder) / f"{name}.{artifact_format}"
+    writer(df, path)
+    log.info("Artifact %s written to %s", name, path)
+    return path
+
+
+@timeit
+@shapeit
+def write_artifact_part(
+    df: pd.DataFrame,
+    folder: Path,
+    name: str,
+    part: int,
+    artifact_format: str = DEFAULT_ARTIFACT_FORMAT,
+) -> Path:
+    """
+    Appends a partition to a dataset artifact written chunk by chunk.
+
+    The partitions are stored in a folder named after the dataset, and are read
+    back together by `read_artifact`.
+
+    :param df: partition to write
+    :param folder: artifact folder
+    :param name: dataset name
+    :param part: partition number
+    :param artifact_format: one of `ARTIFACT_FORMATS`, defaults to parquet
+    :return: path of the written file
+    """
+    if artifact_format not in ARTIFACT_FORMATS:
+        raise NotImplementedError(f"Unknown artifact format: {artifact_format}")
+    _, writer = ARTIFACT_FORMATS[artifact_format]
+    part_folder = Path(folder) / name
+    part_folder.mkdir(parents=True, exist_ok=True)
+    path = part_folder / f"part-{part:05d}.{artifact_format}"
+    writer(df, path)
+    log.info("Artifact %s partition %d written to %s", name, part, path)
+    return path
+
+
+@timeit
+@shapeit
+def read_artifact(
+    folder: Path,
+    name: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List] = None,
+) -> pd.DataFrame:
+    """
+    Reads a dataset artifact written by `write_artifact`, whatever its format.
+
+    :param folder: artifact folder
+    :param name: dataset name, without extension
+    :param columns: subset of columns to read, defaults to all of them
+    :param filters: row filters in the pyarrow format, e.g. `[("date", ">=", start)]`,
+        pushed down to the reader so that skipped rows are not loaded
+    :return: the dataset, with its dtypes when the format keeps them
+    """
+    path = get_artifact_path(folder, name)
+    kwargs = {"columns": columns}
+    if filters:
+        kwargs["filters"] = filters
+    if path.is_dir():
+        parts = []
+        for part_path in sorted(path.glob("part-*")):
+            reader, _ = ARTIFACT_FORMATS[part_path.suffix[1:]]
+            parts.append(reader(part_path, **kwargs))
+        if not parts:
+            raise FileNotFoundError(f"Artifact {name} in {folder} has no partition")
+        return _concat_parts(parts)
+    reader, _ = ARTIFACT_FORMATS[path.suffix[1:]]
+    return reader(path, **kwargs)
+
+
+def hash_artifact(folder: Path, name: str) -> str:
+    """
+    Computes a hash of the content of a dataset artifact, partitioned or not.
+
+    :param folder: artifact folder
+    :param name: dataset name, without extension
+    :return: hexadecimal MD5 digest of the artifact files
+    """
+    path = get_artifact_path(folder, name)
+    paths = sorted(path.glob("part-*")) if path.is_dir() else [path]
+    md5 = hashlib.md5()
+    for file_path in paths:
+        with open(file_path, "rb") as stream:
+            for block in iter(lambda: stream.read(1 << 20), b""):
+                md5.update(block)
+    return md5.hexdigest()
+
+
+@timeit
+@shapeit
+def read_artifact_rows(
+    folder: Path,
+    name: str,
+    start: int,
+    stop: int,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Reads a range of rows of a dataset artifact written by `write_artifact`.
+
+    Parquet artifacts are memory-mapped and only the row groups overlapping
+    the range are decoded.
+
+    :param folder: artifact folder
+    :param name: dataset name, without extension
+    :param start: first row of the range
+    :param stop: row after the last row of the range
+    :param columns: subset of columns to read, defaults to all of them
+    :return: the rows, with a fresh index
+    """
+    path = get_artifact_path(folder, name)
+    if path.is_dir():
+        raise NotImplementedError(
+            "Row ranges of partitioned artifacts are not supported"
+        )
+    artifact_format = path.suffix[1:]
+    if artifact_format in _ROW_RANGE_READERS:
+        df = _ROW_RANGE_READERS[artifact_format](path, start, stop, columns=columns)
+    else:
+        reader, _ = ARTIFACT_FORMATS[artifact_format]
+        df = reader(path, columns=columns).iloc[start:stop]
+    return df.reset_index(drop=True)
+
+
+def iter_artifact_rows(
+    folder: Path,
+    name: str,
+    start: int,
+    stop: int,
+    batch_size: int,
+    columns: Optional[List[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Reads a range of rows of a dataset artifact batch by batch.
+
+    Parquet artifacts are decoded one row group at a time, so that memory is
+    bounded by the row group size whatever the size of the range. Batches
+    do not span row groups and may be smaller than `batch_size`.
+
+    :param folder: artifact folder
+    :param name: dataset name, without extension
+    :param start: first row of the range
+    :param stop: row after the last row of the range
+    :param batch_size: maximum number of rows per batch
+    :param columns: subset of columns to read, defaults to all of them
+    :return: generator of batches, each with a fresh index
+    """
+    path = get_artifact_path(folder, name)
+    if path.is_dir():
+        raise NotImplementedError(
+            "Row ranges of partitioned artifacts are not supported"
+        )
+    artifact_format = path.suffix[1:]
+    if artifact_format in _ROW_BATCH_READERS:
+        batches = _ROW_BATCH_READERS[artifact_format](
+            path, start, stop, batch_size, columns=columns
+        )
+    else:
+        df = read_artifact_rows(folder, name, start, stop, columns=columns)
+        batches = (df.iloc[i : i + batch_size] for i in range(0, len(df), batch_size))
+    for batch in batches:
+        yield batch.reset_index(drop=True)
+
+
+def get_artifact_columns(folder: Path, name: str) -> List[str]:
+    """
+    Lists the columns of a dataset artifact without reading its rows.
+
+    :param folder: artifact folder
+    :param name: dataset name, without extension
+    :return: column names
+    """
+    path = get_artifact_path(folder, name)
+    if path.is_dir():
+        path = sorted(path.glob("part-*"))[0]
+    if path.suffix == ".parquet":
+        return pq.read_schema(path).names
+    if path.suffix == ".csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    reader, _ = ARTIFACT_FORMATS[path.suffix[1:]]
+    return list(reader(path).columns)
@@ -29,3 +29,44 @@ def shapeit(method: Callable) -> Callable:
         return result
 
     return wrapped
+
+
+def memit(method: Callable) -> Callable:
+    """
+    Logs the memory of each column before and after a dataframe transformation.
+
+    Object columns are only measured deeply, string by string, with debug
+    logging on: the deep scan costs about as much as the downcasts it reports.
+    """
+
+    @wraps(method)
+    def wrapped(*args, **kw) -> Any:
+        if (
+            not args
+            or not isinstance(args[0], pd.DataFrame)
+            or not log.isEnabledFor(logging.INFO)
+        ):
+            return method(*args, **kw)
+        deep = log.isEnabledFor(logging.DEBUG)
+        before = args[0].memory_usage(index=False, deep=deep)
+        result = method(*args, **kw)
+        if isinstance(result, pd.DataFrame):
+            after = result.memory_usage(index=False, deep=deep)
+            for col in after.index:
+                log.info(
+                    "%r: %s %.2fMB -> %.2fMB (%s)",
+                    method.__name__,
+                    col,
+                    before.get(col, 0) / 1048576,
+                    after[col] / 1048576,
+                    result[col].dtype,
+                )
+            log.info(
+                "%r: memory %.2fMB -> %.2fMB",
+                method.__name__,
+                before.sum() / 1048576,
+                after.sum() / 1048576,
+            )
+        return result
+
+    return wrapped
@@ -0,0 +1,148 @@
+import hashlib
+import inspect
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd  # type: ignore
+
+from components.base_images.utils.artifacts import (
+    get_artifact_path,
+    read_artifact,
+    write_artifact,
+)
+
+log = logging.getLogger()
+
+_ROW_ID = "__feature_cache_row_id__"
+
+
+class FeatureCache:
+    """
+    Cache of feature blocks, stored as Parquet files in a folder.
+
+    A block is the set of columns a function adds to a dataset. It is stored
+    under a key hashing the input artifact, the source code computing the
+    block, its parameters and the keys of the blocks it depends on, so that a
+    run only recomputes the blocks whose inputs changed. On Vertex, a folder
+    under /gcs/<bucket>/ persists the cache in Cloud Storage.
+    """
+
+    def __init__(self, folder: Optional[str], input_hash: str):
+        """
+        Creates a feature cache.
+
+        :param folder: cache folder, None to disable the cache
+        :param input_hash: hash of the input artifact, see `hash_artifact`
+        """
+        self.folder = Path(folder) if folder else None
+        self.input_hash = input_hash
+        self.hits = 0
+        self.misses = 0
+        self.keys: Dict[str, str] = {}
+
+    def block_key(
+        self,
+        name: str,
+        params: Dict[str, Any],
+        sources: List[Any],
+        depends_on: List[str],
+    ) -> str:
+        """
+        Computes the key of a block.
+
+        :param name: block name
+        :param params: parameters of the function computing the block
+        :param sources: functions or modules whose source code the block depends on
+        :param depends_on: names of the blocks already added that the block uses
+        :return: hexadecimal MD5 digest
+        """
+        md5 = hashlib.md5(self.input_hash.encode())
+        md5.update(name.encode())
+        md5.update(json.dumps(params, sort_keys=True, default=str).encode())
+        for source in sources:
+            md5.update(inspect.getsource(source).encode())
+        for dependency in depends_on:
+            md5.update(self.keys[dependency].encode())
+        return md5.hexdigest()
+
+    def add_block(
+        self,
+        df: pd.DataFrame,
+        name: str,
+        compute: Callable[..., pd.DataFrame],
+        params: Dict[str, Any] = None,
+        sources: List[Any] = None,
+        depends_on: List[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Adds a block of features to a dataset, from the cache when possible.
+
+        :param df: dataset
+        :param name: block name
+        :param compute: function computing the block, called as `compute(df, **params)`.
+            It must keep all the rows, in any order.
+        :param params: parameters of `compute`, JSON serializable
+        :param sources: functions or modules whose source code the block depends on,
+            defaults to `compute`
+        :param depends_on: names of the blocks already added that `compute` uses
+        :return: dataset with the block columns, in the order of `df`
+        """
+        params = params or {}
+        key = self.block_key(name, params, sources or [compute], depends_on or [])
+        self.keys[name] = key
+        if self.folder is None:
+            block = self._compute_block(df, compute, params)
+        else:
+            block = self._get_block(df, name, key, compute, params)
+
+        block.index = df.index
+        return pd.concat(
+            [df.drop(columns=block.columns, errors="ignore"), block], axis=1
+        )
+
+    def _get_block(
+        self,
+        df: pd.DataFrame,
+        name: str,
+        key: str,
+        compute: Callable[..., pd.DataFrame],
+        params: Dict[str, Any],
+    ) -> pd.DataFrame:
+        """Reads a block from the cache, or computes and stores it."""
+        block_folder = self.folder / name
+        try:
+            get_artifact_path(block_folder, key)
+        except FileNotFoundError:
+            self.misses += 1
+            log.info("Feature cache miss for block %s (%s)", name, key)
+            block = self._compute_block(df, compute, params)
+            block_folder.mkdir(parents=True, exist_ok=True)
+            write_artifact(block, block_folder, key)
+            return block
+        self.hits += 1
+        log.info("Feature cache hit for block %s (%s)", name, key)
+        return read_artifact(block_folder, key)
+
+    @staticmethod
+    def _compute_block(
+        df: pd.DataFrame, compute: Callable[..., pd.DataFrame], params: Dict[str, Any]
+    ) -> pd.DataFrame:
+        """Computes the columns added or changed by a function, in the order of `df`."""
+        result = compute(df.assign(**{_ROW_ID: np.arange(len(df))}), **params)
+        if len(result) != len(df):
+            raise ValueError("Cached feature blocks must keep all the rows")
+        columns = [
+            col
+            for col in result.columns
+            if col != _ROW_ID
+            and (col not in df.columns or result[col].dtype != df[col].dtype)
+        ]
+        order = np.argsort(result[_ROW_ID].to_numpy(), kind="stable")
+        return result[columns].iloc[order].reset_index(drop=True)
+
+    def log_stats(self) -> None:
+        """Logs the numbers of blocks read from the cache and computed."""
+        log.info("Feature cache: %d hits, %d misses", self.hits, self.misses)
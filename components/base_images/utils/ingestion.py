@@ -0,0 +1,176 @@
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd  # type: ignore
+
+from components.base_images.utils.artifacts import (
+    DEFAULT_ARTIFACT_FORMAT,
+    get_artifact_path,
+    write_artifact,
+)
+from components.base_images.utils.storage import file_md5
+
+log = logging.getLogger()
+
+
+def get_csv_dtypes(columns: List[str], dtypes: Dict[str, str]) -> Dict[str, str]:
+    """
+    Resolves the dtypes of the columns of a CSV file.
+
+    :param columns: columns of the file, from its header
+    :param dtypes: dtypes by column name or pattern, e.g. `{"d_*": "int16"}`,
+        the first matching entry being used
+    :return: dtypes of the matching columns, the others being inferred by pandas
+    """
+    resolved = {}
+    for col in columns:
+        for pattern, dtype in dtypes.items():
+            if fnmatch.fnmatchcase(col, pattern):
+                resolved[col] = dtype
+                break
+    return resolved
+
+
+def read_csv_with_dtypes(path: Path, dtypes: Dict[str, str] = None) -> pd.DataFrame:
+    """
+    Reads a CSV file with explicit dtypes, so that they are not inferred from the values.
+
+    :param path: file path
+    :param dtypes: dtypes by column name or pattern, see `get_csv_dtypes`
+    :return: the file content
+    """
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    return pd.read_csv(path, dtype=get_csv_dtypes(columns, dtypes or {}))
+
+
+def get_source_key(md5: Optional[str], generation: str, source: Dict[str, Any]) -> str:
+    """
+    Computes the cache key of an ingested source.
+
+    The key hashes the content checksum of the file, its generation when it has
+    no checksum, and the parsing options, so that a source is only parsed again
+    when its content or the way it is parsed changed.
+
+    :param md5: base64 MD5 of the file, None if unknown
+    :param generation: version of the file
+    :param source: parsing options of the source
+    :return: hexadecimal MD5 digest
+    """
+    key = hashlib.md5((md5 or f"generation-{generation}").encode())
+    key.update(json.dumps(source, sort_keys=True).encode())
+    return key.hexdigest()
+
+
+def _copy_artifact(path: Path, folder: Path, name: str) -> Path:
+    destination = Path(folder) / f"{name}{path.suffix}"
+    tmp_path = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+    shutil.copyfile(path, tmp_path)
+    tmp_path.replace(destination)
+    return destination
+
+
+def ingest_source(
+    backend,
+    bucket: str,
+    name: str,
+    source: Dict[str, Any],
+    output_folder: Path,
+    cache_folder: str = None,
+    artifact_format: str = DEFAULT_ARTIFACT_FORMAT,
+) -> bool:
+    """
+    Downloads and parses a raw CSV file into a dataset artifact.
+
+    The artifact is copied from the cache when the checksum of the file and
+    its parsing options did not change since it was cached.
+
+    :param backend: `GCSBackend` or `LocalBackend`
+    :param bucket: bucket of the raw files
+    :param name: dataset name of the artifact
+    :param source: parsing options, `file` (path in the bucket) and `dtype`
+        (dtypes by column name or pattern)
+    :param output_folder: artifact folder
+    :param cache_folder: folder of the parsed sources, None to disable the cache.
+        On Vertex, a folder under /gcs/<bucket>/ persists it in Cloud Storage.
+    :param artifact_format: one of `ARTIFACT_FORMATS`
+    :return: whether the artifact was copied from the cache
+    """
+    generation, md5 = backend.get_checksum(bucket, source["file"])
+    key = get_source_key(md5, generation, {**source, "format": artifact_format})
+    if cache_folder:
+        try:
+            cached = get_artifact_path(Path(cache_folder) / name, key)
+        except FileNotFoundError:
+            pass
+        else:
+            _copy_artifact(cached, output_folder, name)
+            log.info(f"Source {bucket}/{source['file']} unchanged, read from cache")
+            return True
+
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        path = Path(tmp_folder) / Path(source["file"]).name
+        backend.download(bucket, source["file"], path)
+        if md5 is not None and file_md5(path) != md5:
+            raise IOError(f"Checksum mismatch for source {bucket}/{source['file']}")
+        df = read_csv_with_dtypes(path, source.get("dtype"))
+    artifact_path = write_artifact(df, output_folder, name, artifact_format)
+    if cache_folder:
+        (Path(cache_folder) / name).mkdir(parents=True, exist_ok=True)
+        _copy_artifact(artifact_path, Path(cache_folder) / name, key)
+    log.info(f"Source {bucket}/{source['file']} ingested: {df.shape}")
+    return False
+
+
+def ingest_sources(
+    backend,
+    bucket: str,
+    sources: Dict[str, Dict[str, Any]],
+    output_folder: Path,
+    cache_folder: str = None,
+    artifact_format: str = DEFAULT_ARTIFACT_FORMAT,
+    n_workers: int = 4,
+) -> Dict[str, bool]:
+    """
+    Ingests raw CSV files concurrently, each into a dataset artifact.
+
+    Downloads and parsing mostly release the GIL, so the sources are ingested
+    by a thread pool.
+
+    :param backend: `GCSBackend` or `LocalBackend`
+    :param bucket: bucket of the raw files
+    :param sources: parsing options by dataset name, see `ingest_source`
+    :param output_folder: artifact folder
+    :param cache_folder: folder of the parsed sources, None to disable the cache
+    :param artifact_format: one of `ARTIFACT_FORMATS`
+    :param n_workers: number of sources ingested at the same time
+    :return: whether each source was copied from the cache, by dataset name
+    """
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, n_workers)) as executor:
+        futures = {
+            name: executor.submit(
+                ingest_source,
+                backend,
+                bucket,
+                name,
+                source,
+                output_folder,
+                cache_folder,
+                artifact_format,
+            )
+            for name, source in sources.items()
+        }
+        cached = {name: future.result() for name, future in futures.items()}
+    log.info(
+        f"{sum(cached.values())} of {len(cached)} sources unchanged, read from cache"
+    )
+    return cached
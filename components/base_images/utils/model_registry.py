@@ -0,0 +1,98 @@
+import base64
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+import joblib
+
+from components.base_images.utils.storage import GCSBackend, file_md5
+
+log = logging.getLogger()
+
+DEFAULT_CACHE_FOLDER = Path(tempfile.gettempdir()) / "model_registry"
+
+# Models loaded in this process, by bucket, blob name and checksum
+_LOADED_MODELS: Dict[Tuple[str, str, str], Any] = {}
+
+
+class ModelRegistry:
+    """
+    Client of the models deployed in a bucket, with a local cache.
+
+    Model files are cached under a key made of their generation and MD5, so
+    that a model is only downloaded when it changed, and the downloads are
+    checked against the MD5. Loaded models are kept for the lifetime of the
+    process.
+    """
+
+    def __init__(self, backend=None, cache_folder: str = None):
+        """
+        Creates a model registry client.
+
+        :param backend: `GCSBackend` or `LocalBackend`, defaults to GCS
+        :param cache_folder: local cache folder, defaults to a temporary folder
+        """
+        self.backend = backend if backend is not None else GCSBackend()
+        self.cache_folder = Path(cache_folder or DEFAULT_CACHE_FOLDER)
+
+    def fetch(self, bucket: str, name: str) -> Path:
+        """
+        Gets a local copy of a model file, downloading it only if it changed.
+
+        :param bucket: bucket name
+        :param name: blob name
+        :return: path of the cached file
+        """
+        generation, md5 = self.backend.get_checksum(bucket, name)
+        key = f"{generation}-{base64.b64decode(md5).hex() if md5 else 'nomd5'}"
+        path = self.cache_folder / bucket / name / key / Path(name).name
+        if path.exists():
+            log.info(f"Model {bucket}/{name} found in cache")
+            return path
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        self.backend.download(bucket, name, tmp_path)
+        if md5 is not None and file_md5(tmp_path) != md5:
+            tmp_path.unlink()
+            raise IOError(f"Checksum mismatch for model {bucket}/{name}")
+        tmp_path.replace(path)
+        log.info(f"Model {bucket}/{name} downloaded to {path}")
+        return path
+
+    def load_model(
+        self, bucket: str, name: str, loader: Callable[[Path], Any] = joblib.load
+    ) -> Any:
+        """
+        Loads a model, once per process and version.
+
+        :param bucket: bucket name
+        :param name: blob name
+        :param loader: function loading the model from a local file
+        :return: the model
+        """
+        path = self.fetch(bucket, name)
+        key = (bucket, name, path.parent.name)
+        if key not in _LOADED_MODELS:
+            _LOADED_MODELS[key] = loader(path)
+        return _LOADED_MODELS[key]
+
+    def deploy(
+        self,
+        bucket: str,
+        name: str,
+        destination_bucket: str,
+        destination_name: str = None,
+    ) -> None:
+        """
+        Copies a model to the bucket of the deployed models.
+
+        :param bucket: bucket name of the model
+        :param name: blob name of the model
+        :param destination_bucket: bucket name of the deployed models
+        :param destination_name: blob name of the deployed model (defaults to name if not set)
+        """
+        self.backend.copy(bucket, name, destination_bucket, destination_name or name)
+        log.info(f"Model {bucket}/{name} deployed to {destination_bucket}")
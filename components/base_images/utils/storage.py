@@ -1,9 +1,45 @@
+import base64
+import hashlib
+import io
+import itertools
+import logging
+import re
+import shutil
+import sqlite3
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
 import pandas as pd
-import pandas_gbq
-from google.oauth2 import service_account
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+from components.base_images.utils.artifacts import (
+    get_artifact_path,
+    read_artifact,
+    write_artifact_part,
+)
 from components.base_images.utils.decorator import shapeit, timeit
 
+log = logging.getLogger()
+
+# Column schema of a table: (name, BigQuery type) pairs
+Schema = List[Tuple[str, str]]
+
+_BQ_ARROW_TYPES = {
+    "INT64": pa.int64(),
+    "FLOAT64": pa.float64(),
+    "BOOL": pa.bool_(),
+    "STRING": pa.string(),
+    "DATE": pa.date32(),
+    "TIMESTAMP": pa.timestamp("us"),
+}
+
+# Credentials and clients created in this process, by key file and project
+_CREDENTIALS: Dict[str, Any] = {}
+_BQ_CLIENTS: Dict[Tuple[str, Optional[str]], Any] = {}
+_BQ_STORAGE_CLIENTS: Dict[Optional[str], Any] = {}
+
 
 @timeit
 @shapeit
@@ -12,13 +48,68 @@ def read_from_gcs(bucket: str, filename: str):
     return pd.read_csv(f"gs://{bucket}/{filename}.csv")
 
 
+def get_credentials(key_path: str = None):
+    """
+    Loads the credentials of a service account key file, once per process.
+
+    :param key_path: service account key file
+    :return: the credentials, None for the default credentials if no key file is set
+    """
+    if not key_path:
+        return None
+    if key_path not in _CREDENTIALS:
+        from google.oauth2 import service_account
+
+        _CREDENTIALS[key_path] = service_account.Credentials.from_service_account_file(
+            key_path
+        )
+    return _CREDENTIALS[key_path]
+
+
+def get_bq_client(project_id: str, key_path: str = None):
+    """
+    Creates a BigQuery client, once per process, project and key file.
+
+    :param project_id: GCP project of the queries
+    :param key_path: service account key file, default credentials if not set
+    :return: the BigQuery client
+    """
+    key = (project_id, key_path)
+    if key not in _BQ_CLIENTS:
+        from google.cloud import bigquery
+
+        _BQ_CLIENTS[key] = bigquery.Client(
+            project=project_id, credentials=get_credentials(key_path)
+        )
+    return _BQ_CLIENTS[key]
+
+
+def get_bq_storage_client(key_path: str = None):
+    """
+    Creates a BigQuery Storage read client, once per process and key file.
+
+    :param key_path: service account key file, default credentials if not set
+    :return: the read client, None if google-cloud-bigquery-storage is not installed
+    """
+    if key_path not in _BQ_STORAGE_CLIENTS:
+        try:
+            from google.cloud import bigquery_storage
+        except ImportError:
+            log.info("BigQuery Storage API client not installed, reading pages")
+            _BQ_STORAGE_CLIENTS[key_path] = None
+        else:
+            _BQ_STORAGE_CLIENTS[key_path] = bigquery_storage.BigQueryReadClient(
+                credentials=get_credentials(key_path)
+            )
+    return _BQ_STORAGE_CLIENTS[key_path]
+
+
 @timeit
 @shapeit
 def read_from_bq(query, project_id, key_path=None, progress_bar_type=None):
-    if key_path:
-        credentials = service_account.Credentials.from_service_account_file(key_path)
-    else:
-        credentials = None
+    import pandas_gbq
+
+    credentials = get_credentials(key_path)
 
     return pandas_gbq.read_gbq(
         query,
@@ -26,3 +117,726 @@ def read_from_bq(query, project_id, key_path=None, progress_bar_type=None):
         credentials=credentials,
         progress_bar_type=progress_bar_type,
     )
+
+
+def _to_batches(table: pa.Table) -> List[pa.RecordBatch]:
+    return table.to_batches() if isinstance(table, pa.Table) else [table]
+
+
+def _common_type(types: List[pa.DataType]) -> pa.DataType:
+    types = [
+        arrow_type for arrow_type in set(types) if not pa.types.is_null(arrow_type)
+    ]
+    if len(types) <= 1:
+        return types[0] if types else pa.null()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.string()
+
+
+def _concat_batches(batches: List[pa.RecordBatch]) -> pa.Table:
+    """Concatenates record batches, casting them to a common schema if they differ."""
+    tables = [pa.Table.from_batches([batch]) for batch in batches]
+    schemas = {table.schema.remove_metadata() for table in tables}
+    if len(schemas) > 1:
+        # Batches of dynamically typed results, e.g. a column only holding
+        # NULL values in some batches or integers in some and floats in others
+        names = tables[0].column_names
+        schema = pa.schema(
+            [
+                (name, _common_type([table.schema.field(i).type for table in tables]))
+                for i, name in enumerate(names)
+            ]
+        )
+        tables = [table.cast(schema) for table in tables]
+    return pa.concat_tables(tables)
+
+
+def _rebatch(batches: Iterator[pa.RecordBatch], batch_size: int) -> Iterator[pa.Table]:
+    """Regroups record batches of any size into tables of batch_size rows."""
+    pending, n_pending = [], 0
+    for batch in batches:
+        pending.append(batch)
+        n_pending += batch.num_rows
+        while n_pending >= batch_size:
+            table = _concat_batches(pending)
+            yield table.slice(0, batch_size)
+            rest = table.slice(batch_size)
+            pending, n_pending = rest.to_batches(), rest.num_rows
+    if n_pending:
+        yield _concat_batches(pending)
+
+
+def iter_query_batches(
+    query: str, backend, batch_size: int = 500000
+) -> Iterator[pa.Table]:
+    """
+    Runs a query and streams its result, without holding the whole result.
+
+    :param query: SQL query
+    :param backend: `BigQueryBackend`, `SQLiteBackend` or `ParquetBackend`
+    :param batch_size: number of rows per batch, the last one being smaller
+    :return: generator of Arrow tables of batch_size rows
+    """
+    return _rebatch(backend.iter_batches(query, batch_size), batch_size)
+
+
+def iter_query_chunks(
+    query: str,
+    backend,
+    batch_size: int = 500000,
+    dtypes: Dict[str, Any] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Runs a query and streams its result as dataframes with fixed dtypes.
+
+    The dtypes are the same in all the chunks, whatever the values they hold,
+    e.g. integer columns with missing values in some chunks only. Categorical
+    columns only share their categories when they are given, as a
+    `pd.CategoricalDtype`.
+
+    :param query: SQL query
+    :param backend: `BigQueryBackend`, `SQLiteBackend` or `ParquetBackend`
+    :param batch_size: number of rows per chunk, the last one being smaller
+    :param dtypes: dtypes of the columns, the others keeping the dtypes read
+    :return: generator of dataframes of batch_size rows
+    """
+    for table in iter_query_batches(query, backend, batch_size):
+        df = table.to_pandas()
+        if dtypes:
+            df = df.astype({col: dtype for col, dtype in dtypes.items() if col in df})
+        yield df
+
+
+@timeit
+def write_query_to_artifact(
+    query: str,
+    backend,
+    folder: Path,
+    name: str,
+    batch_size: int = 500000,
+    dtypes: Dict[str, Any] = None,
+    artifact_format: str = "parquet",
+) -> int:
+    """
+    Streams the result of a query into a partitioned dataset artifact.
+
+    Each chunk is written as a partition, so that the next components, e.g.
+    the chunked preprocessing, read the result without it being held in memory.
+
+    :param query: SQL query
+    :param backend: `BigQueryBackend`, `SQLiteBackend` or `ParquetBackend`
+    :param folder: artifact folder
+    :param name: dataset name
+    :param batch_size: number of rows per partition
+    :param dtypes: dtypes of the columns, see `iter_query_chunks`
+    :param artifact_format: one of `ARTIFACT_FORMATS`
+    :return: number of rows written
+    """
+    n_rows = 0
+    for part, df in enumerate(iter_query_chunks(query, backend, batch_size, dtypes)):
+        write_artifact_part(df, folder, name, part, artifact_format)
+        n_rows += len(df)
+    return n_rows
+
+
+def copy_blob(
+    bucket_name: str,
+    blob_name: str,
+    destination_bucket_name: str,
+    destination_blob_name: str = None,
+    delete_origin: bool = False,
+    client=None,
+) -> None:
+    """
+    Copies a blob from one bucket to another with a new name.
+
+    :param bucket_name: the ID of your GCS bucket
+    :param blob_name: the ID of your GCS object
+    :param destination_bucket_name: the ID of the bucket to copy the object to
+    :param destination_blob_name: the ID of your new GCS object (defaults to blob_name if not set)
+    :param delete_origin: whether to delete the original object, moving it
+    :param client: storage client, a new one is created if not set
+    """
+    from google.cloud import storage
+
+    storage_client = client or storage.Client()
+
+    source_bucket = storage_client.bucket(bucket_name)
+    source_blob = source_bucket.blob(blob_name)
+    if destination_blob_name is None:
+        destination_blob_name = blob_name
+    destination_bucket = storage_client.bucket(destination_bucket_name)
+
+    source_bucket.copy_blob(source_blob, destination_bucket, destination_blob_name)
+    if delete_origin:
+        source_bucket.delete_blob(blob_name)
+
+
+def file_md5(path: Path) -> str:
+    """
+    Computes the MD5 of a file, base64 encoded as in GCS blob metadata.
+
+    :param path: file path
+    :return: base64 encoded MD5 digest
+    """
+    md5 = hashlib.md5()
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(1 << 20), b""):
+            md5.update(block)
+    return base64.b64encode(md5.digest()).decode()
+
+
+class GCSBackend:
+    """Blob storage in Google Cloud Storage buckets."""
+
+    def __init__(self, client=None):
+        """
+        Creates a GCS backend.
+
+        :param client: storage client, a new one is created if not set
+        """
+        # Imported here so that the local backend works without the GCS client
+        from google.cloud import storage
+
+        self.client = client or storage.Client()
+
+    def get_checksum(self, bucket: str, name: str) -> Tuple[str, Optional[str]]:
+        """
+        Reads the version of a blob from its metadata, without downloading it.
+
+        :param bucket: bucket name
+        :param name: blob name
+        :return: blob generation and base64 MD5, None for composite objects
+        """
+        blob = self.client.bucket(bucket).get_blob(name)
+        if blob is None:
+            raise FileNotFoundError(f"No blob gs://{bucket}/{name}")
+        return str(blob.generation), blob.md5_hash
+
+    def download(self, bucket: str, name: str, path: Path) -> None:
+        """
+        Downloads a blob to a local file.
+
+        :param bucket: bucket name
+        :param name: blob name
+        :param path: local file path
+        """
+        self.client.bucket(bucket).blob(name).download_to_filename(str(path))
+
+    def copy(
+        self, bucket: str, name: str, destination_bucket: str, destination_name: str
+    ) -> None:
+        """
+        Copies a blob to another bucket.
+
+        :param bucket: bucket name
+        :param name: blob name
+        :param destination_bucket: destination bucket name
+        :param destination_name: destination blob name
+        """
+        copy_blob(
+            bucket, name, destination_bucket, destination_name, client=self.client
+        )
+
+
+class LocalBackend:
+    """Blob storage in a local folder, each bucket being a subfolder, e.g. for tests."""
+
+    def __init__(self, root: str):
+        """
+        Creates a local backend.
+
+        :param root: folder holding the buckets
+        """
+        self.root = Path(root)
+
+    def get_checksum(self, bucket: str, name: str) -> Tuple[str, Optional[str]]:
+        """
+        Reads the version of a file from its modification time and content.
+
+        :param bucket: bucket folder name
+        :param name: file path in the bucket
+        :return: modification time in nanoseconds and base64 MD5
+        """
+        path = self.root / bucket / name
+        if not path.exists():
+            raise FileNotFoundError(f"No file {path}")
+        return str(path.stat().st_mtime_ns), file_md5(path)
+
+    def download(self, bucket: str, name: str, path: Path) -> None:
+        """
+        Copies a file to a local file.
+
+        :param bucket: bucket folder name
+        :param name: file path in the bucket
+        :param path: local file path
+        """
+        shutil.copyfile(self.root / bucket / name, path)
+
+    def copy(
+        self, bucket: str, name: str, destination_bucket: str, destination_name: str
+    ) -> None:
+        """
+        Copies a file to another bucket folder.
+
+        :param bucket: bucket folder name
+        :param name: file path in the bucket
+        :param destination_bucket: destination bucket folder name
+        :param destination_name: destination file path
+        """
+        destination = self.root / destination_bucket / destination_name
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self.root / bucket / name, destination)
+
+
+def sanitize_bq_column_names(names: List[str]) -> List[str]:
+    """
+    Makes column names valid in BigQuery instead of dropping the invalid ones.
+
+    Invalid characters are replaced by underscores, names starting with a digit
+    are prefixed by one, and duplicates get a numbered suffix.
+
+    :param names: column names
+    :return: sanitized column names, in the same order
+    """
+    sanitized, seen = [], set()
+    for name in names:
+        new_name = re.sub(r"[^A-Za-z0-9_]", "_", str(name))[:290] or "_"
+        if new_name[0].isdigit():
+            new_name = f"_{new_name}"
+        candidate, i = new_name, 1
+        while candidate.lower() in seen:
+            candidate, i = f"{new_name}_{i}", i + 1
+        seen.add(candidate.lower())
+        sanitized.append(candidate)
+    return sanitized
+
+
+def _to_bq_type(arrow_type: pa.DataType) -> str:
+    if pa.types.is_dictionary(arrow_type):
+        return _to_bq_type(arrow_type.value_type)
+    if pa.types.is_integer(arrow_type):
+        return "INT64"
+    if pa.types.is_floating(arrow_type):
+        return "FLOAT64"
+    if pa.types.is_boolean(arrow_type):
+        return "BOOL"
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return "STRING"
+    if pa.types.is_date(arrow_type):
+        return "DATE"
+    if pa.types.is_timestamp(arrow_type):
+        return "TIMESTAMP"
+    if pa.types.is_null(arrow_type):
+        # Columns without any value, e.g. in a CSV chunk
+        return "STRING"
+    raise NotImplementedError(f"No BigQuery type for {arrow_type}")
+
+
+def get_bq_schema(arrow_schema: pa.Schema) -> Schema:
+    """
+    Derives the BigQuery schema of a table from the Arrow schema of an artifact.
+
+    :param arrow_schema: schema of the artifact, e.g. of one of its Parquet files
+    :return: sanitized column names and their BigQuery types
+    """
+    names = sanitize_bq_column_names(arrow_schema.names)
+    return [(name, _to_bq_type(field.type)) for name, field in zip(names, arrow_schema)]
+
+
+def _to_arrow_schema(schema: Schema) -> pa.Schema:
+    return pa.schema([(name, _BQ_ARROW_TYPES[bq_type]) for name, bq_type in schema])
+
+
+def _cast_column(column: pa.ChunkedArray, arrow_type: pa.DataType) -> pa.ChunkedArray:
+    chunks = [
+        chunk.dictionary_decode() if pa.types.is_dictionary(chunk.type) else chunk
+        for chunk in column.chunks
+    ]
+    column = pa.chunked_array(chunks, type=chunks[0].type if chunks else None)
+    if pa.types.is_string(column.type) and pa.types.is_date(arrow_type):
+        # Dates stored as strings, e.g. the categorical dates of the tutorial
+        column = column.cast(pa.timestamp("us"))
+    return column.cast(arrow_type)
+
+
+def _iter_artifact_tables(
+    folder: Path, name: str, batch_size: int
+) -> Iterator[pa.Table]:
+    path = get_artifact_path(folder, name)
+    paths = sorted(path.glob("part-*")) if path.is_dir() else [path]
+    for file_path in paths:
+        if file_path.suffix == ".parquet":
+            parquet_file = pq.ParquetFile(file_path, memory_map=True)
+            for batch in parquet_file.iter_batches(batch_size=batch_size):
+                yield pa.Table.from_batches([batch])
+        elif file_path.suffix == ".csv":
+            for chunk in pd.read_csv(file_path, chunksize=batch_size):
+                yield pa.Table.from_pandas(chunk, preserve_index=False)
+        else:
+            raise NotImplementedError(f"Cannot stream artifact file {file_path}")
+
+
+class BigQueryBackend:
+    """Tables in BigQuery, loaded with Parquet load jobs."""
+
+    def __init__(self, project_id: str, key_path: str = None, client=None):
+        """
+        Creates a BigQuery backend.
+
+        :param project_id: GCP project of the tables
+        :param key_path: service account key file, default credentials if not set
+        :param client: BigQuery client, a new one is created if not set
+        """
+        # Imported here so that the local backend works without the BigQuery client
+        from google.cloud import bigquery
+
+        self.bigquery = bigquery
+        self.client = client or get_bq_client(project_id, key_path)
+        self.key_path = key_path
+
+    def iter_batches(self, query: str, batch_size: int) -> Iterator[pa.RecordBatch]:
+        """
+        Runs a query and streams its result.
+
+        The result is read with the BigQuery Storage API when its client is
+        installed, and page by page otherwise.
+
+        :param query: SQL query, in the BigQuery dialect
+        :param batch_size: number of rows per page, when reading pages
+        :return: generator of record batches, of any size
+        """
+        rows = self.client.query(query).result(page_size=batch_size)
+        for table in rows.to_arrow_iterable(
+            bqstorage_client=get_bq_storage_client(self.key_path)
+        ):
+            yield from _to_batches(table)
+
+    def get_schema(self, table: str) -> Optional[Schema]:
+        """
+        Reads the schema of a table.
+
+        :param table: table id, dataset.table
+        :return: column names and types, None if the table does not exist
+        """
+        from google.api_core.exceptions import NotFound
+
+        try:
+            bq_table = self.client.get_table(table)
+        except NotFound:
+            return None
+        legacy_types = {"INTEGER": "INT64", "FLOAT": "FLOAT64", "BOOLEAN": "BOOL"}
+        return [
+            (field.name, legacy_types.get(field.field_type, field.field_type))
+            for field in bq_table.schema
+        ]
+
+    def create_table(
+        self, table: str, schema: Schema, partition_column: str = None
+    ) -> None:
+        """
+        Creates a table, partitioned by day of a date column if set.
+
+        :param table: table id, dataset.table
+        :param schema: column names and types
+        :param partition_column: DATE or TIMESTAMP column to partition by
+        """
+        bq_table = self.bigquery.Table(
+            f"{self.client.project}.{table}",
+            schema=[
+                self.bigquery.SchemaField(name, bq_type) for name, bq_type in schema
+            ],
+        )
+        if partition_column:
+            bq_table.time_partitioning = self.bigquery.TimePartitioning(
+                type_=self.bigquery.TimePartitioningType.DAY, field=partition_column
+            )
+        self.client.create_table(bq_table)
+
+    def load(self, table: str, chunk: pa.Table, schema: Schema) -> None:
+        """
+        Appends a chunk to a table with a Parquet load job.
+
+        :param table: table id, dataset.table
+        :param chunk: rows, with the table schema
+        :param schema: column names and types
+        """
+        buffer = io.BytesIO()
+        pq.write_table(chunk, buffer)
+        buffer.seek(0)
+        job_config = self.bigquery.LoadJobConfig(
+            source_format=self.bigquery.SourceFormat.PARQUET,
+            schema=[
+                self.bigquery.SchemaField(name, bq_type) for name, bq_type in schema
+            ],
+            write_disposition=self.bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        self.client.load_table_from_file(buffer, table, job_config=job_config).result()
+
+    def insert(self, table: str, staging: str, partition_column: str = None) -> None:
+        """
+        Inserts the rows of a staging table, replacing the partitions they hold if set.
+
+        The deletion and insertion run in one transaction.
+
+        :param table: table id, dataset.table
+        :param staging: staging table id, with the same schema
+        :param partition_column: column whose values in the staging table are replaced
+        """
+        delete = ""
+        if partition_column:
+            delete = (
+                f"DELETE FROM `{table}` WHERE `{partition_column}` IN "
+                f"(SELECT DISTINCT `{partition_column}` FROM `{staging}`);"
+            )
+        self.client.query(
+            f"BEGIN TRANSACTION; {delete} "
+            f"INSERT INTO `{table}` SELECT * FROM `{staging}`; COMMIT TRANSACTION;"
+        ).result()
+
+    def drop_table(self, table: str) -> None:
+        """
+        Deletes a table if it exists.
+
+        :param table: table id, dataset.table
+        """
+        self.client.delete_table(table, not_found_ok=True)
+
+
+class SQLiteBackend:
+    """Tables in a local SQLite database, standing in for BigQuery, e.g. for tests."""
+
+    def __init__(self, database: str):
+        """
+        Creates a SQLite backend.
+
+        :param database: database file path, or ":memory:"
+        """
+        self.connection = sqlite3.connect(database)
+
+    @staticmethod
+    def _name(table: str) -> str:
+        # Dataset and table names joined, SQLite having a single namespace
+        return '"' + table.replace(".", "__") + '"'
+
+    def get_schema(self, table: str) -> Optional[Schema]:
+        """
+        Reads the schema of a table.
+
+        :param table: table id, dataset.table
+        :return: column names and types, None if the table does not exist
+        """
+        rows = self.connection.execute(
+            f"PRAGMA table_info({self._name(table)})"
+        ).fetchall()
+        return [(row[1], row[2]) for row in rows] or None
+
+    def create_table(
+        self, table: str, schema: Schema, partition_column: str = None
+    ) -> None:
+        """
+        Creates a table, SQLite tables not being partitioned.
+
+        :param table: table id, dataset.table
+        :param schema: column names and types
+        :param partition_column: unused
+        """
+        columns = ", ".join(f'"{name}" {bq_type}' for name, bq_type in schema)
+        self.connection.execute(f"CREATE TABLE {self._name(table)} ({columns})")
+        self.connection.commit()
+
+    def load(self, table: str, chunk: pa.Table, schema: Schema) -> None:
+        """
+        Appends a chunk to a table.
+
+        :param table: table id, dataset.table
+        :param chunk: rows, with the table schema
+        :param schema: column names and types
+        """
+        df = chunk.to_pandas(date_as_object=False)
+        for name, bq_type in schema:
+            if bq_type in ["DATE", "TIMESTAMP"]:
+                values = df[name].dt.strftime(
+                    "%Y-%m-%d" if bq_type == "DATE" else "%Y-%m-%d %H:%M:%S.%f"
+                )
+                df[name] = values.where(df[name].notnull(), None)
+        placeholders = ", ".join("?" * len(schema))
+        self.connection.executemany(
+            f"INSERT INTO {self._name(table)} VALUES ({placeholders})",
+            df.astype(object).where(df.notnull(), None).itertuples(index=False),
+        )
+        self.connection.commit()
+
+    def insert(self, table: str, staging: str, partition_column: str = None) -> None:
+        """
+        Inserts the rows of a staging table, replacing the partitions they hold if set.
+
+        The deletion and insertion run in one transaction.
+
+        :param table: table id, dataset.table
+        :param staging: staging table id, with the same schema
+        :param partition_column: column whose values in the staging table are replaced
+        """
+        with self.connection:
+            if partition_column:
+                self.connection.execute(
+                    f'DELETE FROM {self._name(table)} WHERE "{partition_column}" IN '
+                    f'(SELECT DISTINCT "{partition_column}" FROM {self._name(staging)})'
+                )
+            self.connection.execute(
+                f"INSERT INTO {self._name(table)} SELECT * FROM {self._name(staging)}"
+            )
+
+    def drop_table(self, table: str) -> None:
+        """
+        Deletes a table if it exists.
+
+        :param table: table id, dataset.table
+        """
+        self.connection.execute(f"DROP TABLE IF EXISTS {self._name(table)}")
+        self.connection.commit()
+
+    def iter_batches(self, query: str, batch_size: int) -> Iterator[pa.RecordBatch]:
+        """
+        Runs a query and streams its result.
+
+        :param query: SQL query, in the SQLite dialect, dataset.table being
+            written dataset__table
+        :param batch_size: number of rows fetched at a time
+        :return: generator of record batches
+        """
+        cursor = self.connection.execute(query)
+        columns = [description[0] for description in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pa.RecordBatch.from_pandas(
+                pd.DataFrame.from_records(rows, columns=columns), preserve_index=False
+            )
+
+
+class ParquetBackend(SQLiteBackend):
+    """
+    Queries run against dataset artifacts, standing in for BigQuery, e.g. for tests.
+
+    The artifact `<folder>/<dataset>/<table>.parquet` is the table
+    dataset.table, with or without project and backquotes in the queries.
+    The tables a query uses are loaded in an in-memory SQLite database, so
+    the queries must be valid in SQLite.
+    """
+
+    def __init__(self, folder: str):
+        """
+        Creates a Parquet backend.
+
+        :param folder: folder of the datasets, each being a subfolder
+        """
+        super().__init__(":memory:")
+        self.folder = Path(folder)
+        self.loaded = set()
+
+    def _load_tables(self, query: str) -> str:
+        for path in sorted(self.folder.glob("*/*")):
+            dataset, table = path.parent.name, path.name.split(".")[0]
+            table_id = f"{dataset}.{table}"
+            pattern = rf"`?(?:[\w-]+\.)?\b{re.escape(table_id)}\b`?"
+            if not re.search(pattern, query):
+                continue
+            name = self._name(table_id)
+            if table_id not in self.loaded:
+                df = read_artifact(path.parent, table)
+                df.to_sql(name.strip('"'), self.connection, index=False)
+                self.loaded.add(table_id)
+                log.info(f"Table {table_id} loaded from {path}")
+            query = re.sub(pattern, name, query)
+        return query
+
+    def iter_batches(self, query: str, batch_size: int) -> Iterator[pa.RecordBatch]:
+        """
+        Runs a query on the dataset artifacts and streams its result.
+
+        :param query: SQL query, in the SQLite dialect
+        :param batch_size: number of rows fetched at a time
+        :return: generator of record batches
+        """
+        return super().iter_batches(self._load_tables(query), batch_size)
+
+
+@timeit
+def write_artifact_to_table(
+    folder: Path,
+    name: str,
+    table: str,
+    backend,
+    partition_column: str = None,
+    batch_size: int = 500000,
+) -> int:
+    """
+    Streams a dataset artifact into a table, chunk by chunk.
+
+    The table schema is pinned: it is derived from the artifact dtypes when
+    the table is created, and an artifact with another schema is rejected
+    instead of replacing the table. Chunks are loaded into a staging table,
+    then inserted at once, replacing the partitions of the loaded dates if a
+    partition column is set and appending the rows otherwise.
+
+    :param folder: artifact folder
+    :param name: dataset name, partitioned or not
+    :param table: table id, dataset.table
+    :param backend: `BigQueryBackend` or `SQLiteBackend`
+    :param partition_column: date column of the partitions to overwrite, after sanitization
+    :param batch_size: number of rows per load job
+    :return: number of rows written
+    """
+    tables = _iter_artifact_tables(folder, name, batch_size)
+    first_chunk = next(tables, None)
+    if first_chunk is None:
+        log.info(f"Artifact {name} is empty, nothing to write")
+        return 0
+    schema = get_bq_schema(first_chunk.schema)
+    if partition_column:
+        if partition_column not in dict(schema):
+            raise ValueError(f"No partition column {partition_column} in {name}")
+        # Tables are partitioned by day, the partition column being a date
+        schema = [
+            (
+                col,
+                "DATE" if col == partition_column and bq_type == "STRING" else bq_type,
+            )
+            for col, bq_type in schema
+        ]
+    arrow_schema = _to_arrow_schema(schema)
+
+    existing_schema = backend.get_schema(table)
+    if existing_schema is None:
+        backend.create_table(table, schema, partition_column)
+    elif existing_schema != schema:
+        raise ValueError(
+            f"Schema of {name} {schema} differs from the schema of {table} "
+            f"{existing_schema}"
+        )
+
+    staging = f"{table}_staging_{uuid.uuid4().hex[:8]}"
+    backend.create_table(staging, schema)
+    n_rows = 0
+    try:
+        for chunk in itertools.chain([first_chunk], tables):
+            if sanitize_bq_column_names(chunk.column_names) != arrow_schema.names:
+                raise ValueError(f"Parts of {name} have different columns")
+            chunk = pa.Table.from_arrays(
+                [
+                    _cast_column(column, field.type)
+                    for column, field in zip(chunk.columns, arrow_schema)
+                ],
+                schema=arrow_schema,
+            )
+            backend.load(staging, chunk, schema)
+            n_rows += chunk.num_rows
+            log.info(f"Loaded {n_rows} rows of {name} into {staging}")
+        backend.insert(table, staging, partition_column)
+    finally:
+        backend.drop_table(staging)
+    log.info(f"Wrote {n_rows} rows of {name} to {table}")
+    return n_rows
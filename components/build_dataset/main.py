@@ -0,0 +1,57 @@
+import os
+
+from kfp.v2.dsl import Dataset, Input, Output, component
+
+
+@component(
+    base_image=f"eu.gcr.io/{os.getenv('GCP_PROJECT_ID')}/base_image_{os.getenv('IMAGE_NAME')}:{os.getenv('IMAGE_TAG')}"
+)
+def build_dataset_step(
+    input_folder: Input[Dataset],
+    output_folder: Output[Dataset],
+    config: dict,
+) -> None:
+    """
+    Bins the training and validation features once for all the models trained on them.
+
+    :param input_folder: the folder of the features and their split index
+    :param output_folder: the folder where the LightGBM binary datasets are saved
+    :param config: the train_model config
+    """
+    from pathlib import Path
+
+    from components.base_images.tutorial.features_engineering.utils import read_split
+    from components.base_images.tutorial.train_model.utils import (
+        prepare_features,
+        save_datasets,
+    )
+
+    categorical_columns = (
+        config["time_columns_categorical"]
+        + config["id_cols"]
+        + config["cols_calendar2"]
+    )
+
+    input_folder = Path(input_folder.path)
+    output_folder = Path(output_folder.path)
+
+    X_train, y_train = (
+        read_split(input_folder, "train", exclude=config["unnecessary_cols"]),
+        read_split(input_folder, "train", columns=["sales"]).values,
+    )
+
+    X_val, y_val = (
+        read_split(input_folder, "val", exclude=config["unnecessary_cols"]),
+        read_split(input_folder, "val", columns=["sales"]).values,
+    )
+    if X_val.shape[0] == 0:
+        X_val, y_val = X_train.tail(2), y_train[-2:]
+
+    save_datasets(
+        prepare_features(X_train, categorical_columns),
+        y_train.ravel(),
+        prepare_features(X_val, categorical_columns),
+        y_val.ravel(),
+        output_folder,
+        params=config.get("dataset_params"),
+    )
@@ -17,10 +17,12 @@ def evaluate_model_step(
     from collections import namedtuple
     from pathlib import Path
 
-    import joblib
-    import pandas as pd
-
     from components.base_images.tutorial.evaluation.evaluate import evaluate
+    from components.base_images.tutorial.features_engineering.utils import read_split
+    from components.base_images.tutorial.train_model.utils import (
+        load_model,
+        prepare_features,
+    )
 
     categorical_columns = (
         config["time_columns_categorical"]
@@ -31,25 +33,19 @@ def evaluate_model_step(
     input_folder = Path(input_folder.path)
     model_artifact = Path(model_artifact.path)
 
-    X_train = pd.read_csv(input_folder / "data_train.csv")
     X_train, y_train = (
-        X_train.drop(config["unnecessary_cols"], axis=1),
-        X_train[["sales"]].values,
+        read_split(input_folder, "train", exclude=config["unnecessary_cols"]),
+        read_split(input_folder, "train", columns=["sales"]).values,
     )
-    X_val = pd.read_csv(input_folder / "data_val.csv")
     X_val, y_val = (
-        X_val.drop(config["unnecessary_cols"], axis=1),
-        X_val[["sales"]].values,
+        read_split(input_folder, "val", exclude=config["unnecessary_cols"]),
+        read_split(input_folder, "val", columns=["sales"]).values,
     )
 
-    categorical_columns_filtered = [
-        c for c in categorical_columns if c in X_val.columns
-    ]
-    for col in categorical_columns_filtered:
-        X_train[col] = pd.Categorical(X_train[col])
-        X_val[col] = pd.Categorical(X_val[col])
+    X_train = prepare_features(X_train, categorical_columns)
+    X_val = prepare_features(X_val, categorical_columns)
 
-    model = joblib.load(model_artifact / "lgb.pkl")
+    model = load_model(model_artifact)
 
     y_pred_train = model.predict(X_train)
     y_pred_val = model.predict(X_val)
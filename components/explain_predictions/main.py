@@ -30,14 +30,25 @@ def explain_predictions_step(
 
     import joblib
     import matplotlib.pyplot as plt
+    import numpy as np
     import pandas as pd
     import shap
 
+    from components.base_images.tutorial.explain_predictions.explainability import (
+        aggregate_shap_values,
+        compute_shap_values,
+        sample_per_group,
+    )
+    from components.base_images.tutorial.features_engineering.utils import read_split
+    from components.base_images.tutorial.train_model.utils import prepare_features
+    from components.base_images.utils.artifacts import write_artifact
+
     categorical_columns = (
         config["time_columns_categorical"]
         + config["id_cols"]
         + config["cols_calendar2"]
     )
+    artifact_format = config.get("artifact_format", "parquet")
 
     input_folder = Path(input_folder.path)
     model_artifact = Path(model_artifact.path)
@@ -45,23 +56,59 @@ def explain_predictions_step(
 
     model = joblib.load(model_artifact / "lgb.pkl")
 
-    X_val = pd.read_csv(input_folder / "data_val.csv")
-    X_val, y_val = (
-        X_val.drop(config["unnecessary_cols"], axis=1),
-        X_val[["sales"]].values,
-    )
+    X_val = read_split(input_folder, "val", exclude=config["unnecessary_cols"])
 
-    categorical_columns_filtered = [
-        c for c in categorical_columns if c in X_val.columns
-    ]
-    for col in categorical_columns_filtered:
-        X_val[col] = pd.Categorical(X_val[col])
+    # A few rows per article are enough for the importances and the plot
+    X_val = sample_per_group(
+        X_val,
+        config.get("shap_strata", ["item_id"]),
+        config.get("shap_rows_per_group"),
+        seed=config.get("shap_seed", 0),
+    )
+    articles = X_val["item_id"].astype(str).to_numpy()
+    X_val = prepare_features(X_val, categorical_columns)
 
-    explainer = shap.TreeExplainer(model)
-    shap_values = explainer.shap_values(X_val)
+    shap_values, expected_value = compute_shap_values(
+        model,
+        X_val,
+        backend=config.get("shap_backend", "pred_contrib"),
+        batch_size=config.get("shap_batch_size", 100000),
+        n_jobs=config.get("shap_n_jobs", 0),
+    )
+    logging.info(f"Expected value: {expected_value}")
 
     logging.info(f"Model folder name: {model_artifact}")
     output_folder.mkdir(parents=True, exist_ok=True)
+    if not len(X_val):
+        # e.g. a validation start date after the last day with sales
+        logging.warning("No validation row to explain, writing empty explanations")
+        empty_df = pd.DataFrame(columns=X_val.columns)
+        write_artifact(empty_df, output_folder, "shap_values", artifact_format)
+        write_artifact(empty_df, output_folder, "shap_per_article", artifact_format)
+        write_artifact(
+            pd.DataFrame({"feature": X_val.columns, "mean_abs_shap": np.nan}),
+            output_folder,
+            "shap_importance",
+            artifact_format,
+        )
+        return
+
     # save these  files in a folder
     shap.summary_plot(shap_values, X_val, plot_type="bar", show=False)
     plt.savefig(output_folder / "summary_plot.pdf")
+
+    # Categorical features are native LightGBM ones, there is no one hot encoding
+    raw_shap_df, scaled_shap_df = aggregate_shap_values(
+        shap_values, X_val.set_index(articles), list(X_val.columns), []
+    )
+    importance_df = pd.DataFrame(
+        {
+            "feature": X_val.columns,
+            "mean_abs_shap": np.abs(shap_values).mean(axis=0),
+        }
+    ).sort_values("mean_abs_shap", ascending=False)
+    write_artifact(raw_shap_df, output_folder, "shap_values", artifact_format)
+    write_artifact(
+        scaled_shap_df.reset_index(), output_folder, "shap_per_article", artifact_format
+    )
+    write_artifact(importance_df, output_folder, "shap_importance", artifact_format)
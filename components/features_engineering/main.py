@@ -11,50 +11,114 @@ def features_engineering_step(
     output_folder: Output[Dataset],
     config: dict,
 ) -> None:
+    import logging
+    from functools import partial
     from pathlib import Path
 
     import pandas as pd
 
+    from components.base_images.tutorial.features_engineering import (
+        lags_and_rolling,
+        price_features,
+        sharding,
+        time_features,
+    )
+    from components.base_images.tutorial.features_engineering.incremental import (
+        get_feature_table_end,
+        get_lookback_days,
+        write_feature_table,
+    )
     from components.base_images.tutorial.features_engineering.lags_and_rolling import (
-        aggregate_lags,
-        get_lags,
-        get_rolling_means,
+        get_hierarchy_features,
     )
     from components.base_images.tutorial.features_engineering.price_features import (
-        get_pricing_features,
+        get_relative_price_features,
+    )
+    from components.base_images.tutorial.features_engineering.sharding import (
+        get_series_features,
+        run_by_series_shards,
+    )
+    from components.base_images.tutorial.features_engineering.utils import (
+        train_test_split,
+        write_split_index,
     )
-    from components.base_images.tutorial.features_engineering.time_features import (
-        get_time_features,
+    from components.base_images.tutorial.preprocessing.prepare import join_dimension
+    from components.base_images.utils.artifacts import (
+        hash_artifact,
+        read_artifact,
+        write_artifact,
     )
+    from components.base_images.utils.feature_cache import FeatureCache
 
     input_folder = Path(input_folder.path)
     output_folder = Path(output_folder.path)
     output_folder.mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_csv(input_folder / "data_prepared.csv")
-
-    # compute time featues
-    df = get_time_features(df)
+    series = ["store_id", "item_id"]
+    lags = list(range(14, 21)) + [365]
+    rolling_params = {"windows": [7], "shifts": [14, 21, 28]}
+
+    # In incremental mode, only the dates after the persisted feature table are
+    # computed, from the days of history their lags and rolling means need
+    feature_table_folder = config.get("feature_table_folder")
+    table_end = None
+    if config.get("incremental") and feature_table_folder:
+        table_end = get_feature_table_end(feature_table_folder)
+    elif config.get("incremental"):
+        logging.warning(
+            "Incremental features need a feature_table_folder to persist the "
+            "features in, computing them over the full history"
+        )
+
+    if table_end is None:
+        start = None
+        df = read_artifact(input_folder, "data_prepared")
+        # Feature blocks are reused from the cache when their inputs did not change,
+        # the input being only hashed, which reads all of it, for a cache folder
+        cache_folder = config.get("feature_cache_folder")
+        cache = FeatureCache(
+            cache_folder,
+            hash_artifact(input_folder, "data_prepared") if cache_folder else "",
+        )
+    else:
+        start = table_end + pd.Timedelta(days=1)
+        lookback = get_lookback_days(lags, **rolling_params)
+        df = read_artifact(
+            input_folder,
+            "data_prepared",
+            filters=[("date", ">=", start - pd.Timedelta(days=lookback))],
+        )
+        cache = FeatureCache(None, "")
+        logging.info("Computing features from %s, %d rows", start.date(), len(df))
+
+    # compute time features, lags and rolling means over lags 14-20, 21-27 and 28-34
+    # series by series, spread over shards processed in parallel
+    df = cache.add_block(
+        df,
+        "series",
+        compute=partial(
+            run_by_series_shards,
+            function=get_series_features,
+            shard_by=series,
+            n_shards=config.get("n_shards", 1),
+            n_workers=config.get("n_workers", 1),
+        ),
+        params={"lags": lags, "series": series, **rolling_params},
+        sources=[lags_and_rolling, time_features, sharding],
+    )
 
     for col in config["time_columns_categorical"]:
         df[col] = pd.Categorical(df[col])
 
-    # compute lags
-    df = get_lags(df=df, lags=range(14, 35))
-    df = get_lags(df=df, lags=[365])
-
-    for granularity in ["cat_id", "dept_id"]:
-        df = aggregate_lags(df=df, lags=range(14, 35), group_by=granularity)
-        df = aggregate_lags(df=df, lags=[365], group_by=granularity)
-
-    # compute rolling means
-    for granularity in ["", "_cat_id", "_dept_id"]:
-        df = get_rolling_means(df=df, lags=range(14, 21), granularity=granularity)
-        df = get_rolling_means(df=df, lags=range(21, 28), granularity=granularity)
-        df = get_rolling_means(df=df, lags=range(28, 35), granularity=granularity)
-
-    for granularity in ["", "_cat_id", "_dept_id"]:
-        df = df.drop([f"sales_lag_{i}{granularity}" for i in range(21, 35)], axis=1)
+    # aggregate lags and rolling means across series
+    df = cache.add_block(
+        df,
+        "hierarchy",
+        compute=get_hierarchy_features,
+        params={"lags": lags, "levels": ["cat_id", "dept_id"], **rolling_params},
+        sources=[lags_and_rolling],
+        depends_on=["series"],
+    )
 
     # prices features
     price_agg = [
@@ -68,15 +132,46 @@ def features_engineering_step(
         ["item_id", "store_id"],
     ]
 
-    for group_by in price_agg:
-        df = get_pricing_features(df, group_by)
-
-    X_train = df.loc[df["date"] < config["validation_start_date"]]
-    X_val = df.loc[
-        (df["date"] >= config["validation_start_date"]) & (~pd.isnull(df["sales"]))
-    ]
-    X_inference = df.loc[pd.isnull(df["sales"])]
-
-    X_train.to_csv(output_folder / "data_train.csv")
-    X_val.to_csv(output_folder / "data_val.csv")
-    X_inference.to_csv(output_folder / "data_inference.csv")
+    price_params = {
+        "key_sets": price_agg,
+        "stats": config.get("price_stats", ["diff"]),
+        "momentum_lags": config.get("price_momentum_lags", []),
+    }
+
+    if start is None:
+        df = cache.add_block(
+            df,
+            "pricing",
+            compute=get_relative_price_features,
+            params=price_params,
+            sources=[price_features],
+        )
+    else:
+        # Historical price statistics need the whole history of the prices only
+        df = df.loc[df["date"] >= start]
+        price_cols = list(dict.fromkeys(sum(price_agg, series + ["sell_price"])))
+        prices = get_relative_price_features(
+            read_artifact(input_folder, "data_prepared", columns=price_cols),
+            **price_params,
+        )
+        df = join_dimension(
+            df,
+            prices.loc[pd.to_datetime(prices["date"]) >= start],
+            on=series + ["date"],
+            columns=[col for col in prices.columns if col not in price_cols],
+        )
+    cache.log_stats()
+
+    if feature_table_folder:
+        write_feature_table(
+            df.loc[~pd.isnull(df["sales"])],
+            feature_table_folder,
+            append=start is not None,
+        )
+
+    # One feature table ordered by split, consumers read the row range of a split
+    df, split_index = train_test_split(df, "date", config["validation_start_date"])
+    write_artifact(
+        df, output_folder, "features", config.get("artifact_format", "parquet")
+    )
+    write_split_index(split_index, output_folder)
@@ -11,42 +11,44 @@ def prepare_data_step(
 ) -> None:
     from pathlib import Path
 
-    import pandas as pd
-
     from components.base_images.tutorial.preprocessing.prepare import (
-        create_release_date_column,
-        filter_out_sales_before_release_date,
         format_calendar_data,
-        melt_sales_data,
-        merge_sales_calendar,
-        merge_sales_prices,
-        reduce_memory,
+        prepare_sales_by_chunks,
+    )
+    from components.base_images.utils.artifacts import (
+        read_artifact,
+        write_artifact_part,
     )
 
     input_folder = Path(input_folder.path)
     output_folder = Path(output_folder.path)
     output_folder.mkdir(parents=True, exist_ok=True)
 
-    sales_train = pd.read_csv(input_folder / "sales_train.csv")
-    sales_inference = pd.read_csv(input_folder / "sales_inference.csv")
-    prices = pd.read_csv(input_folder / "prices.csv")
-    calendar = pd.read_csv(input_folder / "calendar.csv")
+    sales_train = read_artifact(input_folder, "sales_train")
+    sales_inference = read_artifact(input_folder, "sales_inference")
+    prices = read_artifact(input_folder, "prices")
+    calendar = read_artifact(input_folder, "calendar")
 
-    # Select store CA_1 only
-    sales_train = sales_train.loc[sales_train["store_id"] == "CA_1"]
+    # Select stores, all of them if not specified
+    if config.get("stores"):
+        sales_train = sales_train.loc[sales_train["store_id"].isin(config["stores"])]
 
     df = sales_train.merge(sales_inference, how="left", on=config["id_cols"])
 
-    df = (
-        df.pipe(melt_sales_data, config["id_cols"])
-        .pipe(reduce_memory, config["id_cols"])
-        .pipe(create_release_date_column, prices=prices)
-        .pipe(merge_sales_calendar, calendar=format_calendar_data(calendar))
-        .pipe(filter_out_sales_before_release_date)
-        .pipe(merge_sales_prices, prices=prices)
+    # Melt and merge chunk by chunk to bound memory, each chunk being a partition
+    chunks = prepare_sales_by_chunks(
+        df,
+        prices=prices,
+        calendar=format_calendar_data(calendar),
+        id_cols=config["id_cols"],
+        chunk_by=config.get("chunk_by"),
+        max_rows_per_chunk=config.get("max_rows_per_chunk"),
     )
-
-    for col in config["id_cols"]:
-        df[col] = pd.Categorical(df[col])
-
-    df.to_csv(output_folder / "data_prepared.csv")
+    for part, chunk in enumerate(chunks):
+        write_artifact_part(
+            chunk,
+            output_folder,
+            "data_prepared",
+            part,
+            config.get("artifact_format", "parquet"),
+        )
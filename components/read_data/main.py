@@ -6,20 +6,53 @@ from kfp.v2.dsl import Dataset, Output, component
 @component(
     base_image=f"eu.gcr.io/{os.getenv('GCP_PROJECT_ID')}/base_image_{os.getenv('IMAGE_NAME')}:{os.getenv('IMAGE_TAG')}"
 )
-def get_data_step(input_bucket_raw: str, output_folder: Output[Dataset]):
-    from pathlib import Path
+def get_data_step(
+    input_bucket_raw: str,
+    output_folder: Output[Dataset],
+    artifact_format: str = "parquet",
+    config: dict = None,
+):
+    """
+    Main of read_data component.
+
+    Ingests the raw CSV files concurrently, with explicit dtypes, each into a
+    dataset artifact. Sources whose checksum did not change since the last run
+    are copied from the cache folder instead of being downloaded and parsed.
 
-    from components.base_images.utils.storage import read_from_gcs
+    :param input_bucket_raw: the bucket of the raw files, with or without gs://
+    :param output_folder: the output folder of the raw datasets
+    :param artifact_format: the format of the artifacts
+    :param config: configuration of this component
+    """
+    from pathlib import Path
 
-    sales_train = read_from_gcs(input_bucket_raw, "sales_train.csv")
-    sales_inference = read_from_gcs(input_bucket_raw, "sales_inference.csv")
-    prices = read_from_gcs(input_bucket_raw, "prices.csv")
-    calendar = read_from_gcs(input_bucket_raw, "calendar.csv")
+    from components.base_images.utils.ingestion import ingest_sources
+    from components.base_images.utils.storage import GCSBackend, LocalBackend
 
-    output_folder = Path(output_folder.path)
-    output_folder.mkdir(parents=True, exist_ok=True)
+    config = config or {}
+    sources = config.get(
+        "sources",
+        {
+            name: {"file": f"{name}.csv"}
+            for name in ["sales_train", "sales_inference", "prices", "calendar"]
+        },
+    )
+    # A local folder, each bucket being a subfolder, can stand in for GCS
+    backend = (
+        LocalBackend(config["raw_data_root"])
+        if config.get("raw_data_root")
+        else GCSBackend()
+    )
+    bucket = input_bucket_raw
+    if bucket.startswith("gs://"):
+        bucket = bucket[len("gs://") :]
 
-    sales_train.to_csv(output_folder / "sales_train.csv")
-    sales_inference.to_csv(output_folder / "sales_inference.csv")
-    prices.to_csv(output_folder / "prices.csv")
-    calendar.to_csv(output_folder / "calendar.csv")
+    ingest_sources(
+        backend,
+        bucket,
+        sources,
+        Path(output_folder.path),
+        cache_folder=config.get("cache_folder"),
+        artifact_format=artifact_format,
+        n_workers=config.get("n_workers", len(sources)),
+    )
@@ -13,53 +13,61 @@ def train_model_step(
     output_folder: Output[Dataset],
     config: dict,
 ):
+    import json
     from pathlib import Path
 
     import lightgbm as lgb
-    import pandas as pd
 
-    from components.base_images.tutorial.train_model.utils import log_models
-
-    categorical_columns = (
-        config["time_columns_categorical"]
-        + config["id_cols"]
-        + config["cols_calendar2"]
+    from components.base_images.tutorial.train_model.utils import (
+        load_categorical_columns,
+        load_datasets,
+        log_compiled_model,
+        log_models,
+        log_sweep_models,
+        train_sweep,
     )
 
     input_folder = Path(input_folder.path)
     output_folder = Path(output_folder.path)
     output_folder.mkdir(parents=True, exist_ok=True)
 
-    X_train = pd.read_csv(input_folder / "data_train.csv")
-    X_val = pd.read_csv(input_folder / "data_val.csv")
-    if X_val.shape[0] == 0:
-        X_val = X_train.tail(2)
-
-    X_train, y_train = (
-        X_train.drop(config["unnecessary_cols"], axis=1),
-        X_train[["sales"]].values,
-    )
+    # Sweep mode: one model per configuration, trained in this container
+    if config.get("sweep"):
+        results = train_sweep(
+            input_folder,
+            config["lgb_params"],
+            config["sweep"],
+            n_workers=config.get("sweep_workers", 1),
+            dataset_params=config.get("dataset_params"),
+            num_threads=config.get("sweep_num_threads"),
+            early_stopping_rounds=200,
+            verbose_eval=100,
+        )
+        best = log_sweep_models(
+            model_artifact, results, config["lgb_params"]["metric"], "LightGBM"
+        )
+        if config.get("compile_model"):
+            log_compiled_model(
+                model_artifact, best["model"], load_categorical_columns(input_folder)
+            )
+        with open(output_folder / "sweep_metrics.json", "w") as stream:
+            json.dump(
+                [
+                    {
+                        key: result[key]
+                        for key in ["name", "best_iteration", "best_score"]
+                    }
+                    for result in results
+                ],
+                stream,
+            )
+        return
 
-    X_val, y_val = (
-        X_val.drop(config["unnecessary_cols"], axis=1),
-        X_val[["sales"]].values,
+    # Datasets binned once by build_dataset_step, shared by all the objectives
+    train_data, valid_data = load_datasets(
+        input_folder, params=config.get("dataset_params")
     )
 
-    categorical_columns_filtered = [
-        c for c in categorical_columns if c in X_train.columns
-    ]
-    for col in categorical_columns_filtered:
-        X_train[col] = pd.Categorical(X_train[col])
-        X_val[col] = pd.Categorical(X_val[col])
-
-    import re
-
-    X_train = X_train.rename(columns=lambda x: re.sub("[^A-Za-z0-9_]+", "", x))
-    X_val = X_val.rename(columns=lambda x: re.sub("[^A-Za-z0-9_]+", "", x))
-
-    train_data = lgb.Dataset(X_train, y_train)
-    valid_data = lgb.Dataset(X_val, y_val)
-
     model = lgb.train(
         config["lgb_params"],
         train_data,
@@ -68,3 +76,8 @@ def train_model_step(
         verbose_eval=100,
     )
     log_models(model_artifact, model, "LightGBM")
+    # Compiled copy of the model, predicting faster in the scoring components
+    if config.get("compile_model"):
+        log_compiled_model(
+            model_artifact, model, load_categorical_columns(input_folder)
+        )
@@ -1,6 +1,6 @@
 import os
 
-from kfp.v2.dsl import Dataset, Input, Output, component
+from kfp.v2.dsl import Dataset, Input, Metrics, Output, component
 
 
 @component(
@@ -9,6 +9,7 @@ from kfp.v2.dsl import Dataset, Input, Output, component
 def using_deployed_model(
     input_folder: Input[Dataset],
     output_folder: Output[Dataset],
+    metrics: Output[Metrics],
     bucket_models: str,
     config: dict,
 ):
@@ -16,21 +17,31 @@ def using_deployed_model(
     Main of make_forecasts component.
 
     - Extract trained models and inference data
-    - Compute predictions for the inference data
+    - Compute predictions for the inference data, batch by batch
     - Write predictions to next components
 
     :param input_folder: the input folder of inference data
     :param output_folder: the output folder where predictions are saved
+    :param metrics: the scoring throughput and batch latencies
     :param bucket_models: the input folder of trained models
     """
     import sys
     from pathlib import Path
 
-    import joblib
-    import numpy as np
-    import pandas as pd
     from loguru import logger
 
+    from components.base_images.tutorial.features_engineering.utils import iter_split
+    from components.base_images.tutorial.train_model.utils import (
+        COMPILED_MODEL_FILE,
+        MODEL_FILE,
+        prepare_features,
+    )
+    from components.base_images.tutorial.use_deployed_model.scoring import (
+        score_batches,
+    )
+    from components.base_images.utils.model_registry import ModelRegistry
+    from components.base_images.utils.storage import LocalBackend
+
     logger.add(
         sys.stderr, format="{time} {level} {message}", filter="my_module", level="INFO"
     )
@@ -45,29 +56,41 @@ def using_deployed_model(
         + config["cols_calendar2"]
     )
 
-    X_inference = pd.read_csv(input_folder / "data_inference.csv")
-    X_inference = X_inference.drop(config["unnecessary_cols"], axis=1)
-
-    categorical_columns_filtered = [
-        c for c in categorical_columns if c in X_inference.columns
-    ]
-    for col in categorical_columns_filtered:
-        X_inference[col] = pd.Categorical(X_inference[col])
-
-    from google.cloud import storage
-
-    def load_model(bucket_name: str, file_name: str):
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(file_name).download_to_filename("local_model.pkl")
-        # from_file = CatBoostRegressor()
-        model = joblib.load("local_model.pkl")
-        return model
-
-    model = load_model(
-        bucket_models, "lgb.pkl"
-    )  # joblib.load("gs://" + bucket_models + "/lgb.pkl")
-
-    X_inference["sales_pred"] = np.array(model.predict(X_inference))
-
-    X_inference.to_csv(output_folder / "inference.csv", index=False)
+    # Models are only downloaded when they changed, and loaded once per process
+    registry = ModelRegistry(
+        backend=(
+            LocalBackend(config["model_registry_root"])
+            if config.get("model_registry_root")
+            else None
+        ),
+        cache_folder=config.get("model_cache_folder"),
+    )
+    # The compiled model is used when it was compiled from the deployed model
+    _, model_md5 = registry.backend.get_checksum(bucket_models, MODEL_FILE)
+    try:
+        model = registry.load_model(bucket_models, COMPILED_MODEL_FILE)
+    except FileNotFoundError:
+        model = None
+    if model is None or model.model_md5 != model_md5:
+        logger.info("No compiled model deployed, using the LightGBM model")
+        model = registry.load_model(bucket_models, MODEL_FILE)
+
+    # Batches are read, scored and written one at a time to bound memory
+    key_columns = config.get("inference_key_columns", [])
+    stats = score_batches(
+        model,
+        iter_split(
+            input_folder,
+            "inference",
+            batch_size=config.get("inference_batch_size", 500000),
+            exclude=[c for c in config["unnecessary_cols"] if c not in key_columns],
+        ),
+        output_folder,
+        "inference",
+        prepare=lambda X: prepare_features(X, categorical_columns),
+        num_threads=config.get("inference_num_threads", 0),
+        artifact_format=config.get("artifact_format", "parquet"),
+        key_columns=key_columns,
+    )
+    for key, value in stats.items():
+        metrics.log_metric(key, value)
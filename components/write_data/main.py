@@ -10,7 +10,11 @@ def writing_data(input_folder: Input[Dataset], config: dict):
     """
     Main of write_data component.
 
-    Load data to Big Query.
+    Load data to Big Query, replacing the partitions of the predicted dates.
+
+    The predictions are streamed from their artifact in load jobs of
+    WRITE_BATCH_SIZE rows, into a table whose schema is pinned at creation.
+    Setting LOCAL_DATABASE writes to a SQLite file instead, e.g. for tests.
 
     :param input_folder: the input folder for the inference data
     :config configuration file for this component
@@ -18,22 +22,30 @@ def writing_data(input_folder: Input[Dataset], config: dict):
     import sys
     from pathlib import Path
 
-    import pandas as pd
-    import pandas_gbq
     from loguru import logger
 
+    from components.base_images.utils.storage import (
+        BigQueryBackend,
+        SQLiteBackend,
+        write_artifact_to_table,
+    )
+
     logger.add(
         sys.stderr, format="{time} {level} {message}", filter="my_module", level="INFO"
     )
 
     input_folder = Path(input_folder.path)
-    inference_df = pd.read_csv(input_folder / "inference.csv")
-
-    inference_df = inference_df[[c for c in inference_df.columns if " " not in c]]
-
-    pandas_gbq.to_gbq(
-        inference_df,
+    if config.get("LOCAL_DATABASE"):
+        backend = SQLiteBackend(config["LOCAL_DATABASE"])
+    else:
+        backend = BigQueryBackend(config["PROJECT_ID"])
+
+    n_rows = write_artifact_to_table(
+        input_folder,
+        "inference",
         f"{config['DATASET']}.{config['TABLE']}",
-        if_exists="replace",
-        project_id=config["PROJECT_ID"],
+        backend,
+        partition_column=config.get("PARTITION_COLUMN"),
+        batch_size=config.get("WRITE_BATCH_SIZE", 500000),
     )
+    logger.info(f"{n_rows} predictions written")
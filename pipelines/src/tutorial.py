@@ -1,5 +1,6 @@
 from kfp.v2 import dsl
 
+from components.build_dataset.main import build_dataset_step
 from components.deploy_model.main import deploying_model_step
 from components.evaluate_model.main import evaluate_model_step
 from components.explain_predictions.main import explain_predictions_step
@@ -33,8 +34,10 @@ def training_pipeline() -> None:
 
     # 1. Getting the data from BQ
     # Constant inputs can be send in the pipeline's config file
+    read_data_config = load_component_config("read_data", pipeline_config["uc_name"])
     get_data_task = get_data_step(
         input_bucket_raw=pipeline_config["input_bucket_raw"],
+        config=read_data_config,
     )
 
     # 2. Preparing the data
@@ -50,19 +53,28 @@ def training_pipeline() -> None:
     features_engineering_config = load_component_config(
         "features_engineering", pipeline_config["uc_name"]
     )
-    features_engineering_task = features_engineering_step(
-        input_folder=prepare_data_task.outputs["output_folder"],
-        config=features_engineering_config,
-    ).set_memory_limit("32G")
+    features_engineering_task = (
+        features_engineering_step(
+            input_folder=prepare_data_task.outputs["output_folder"],
+            config=features_engineering_config,
+        )
+        .set_cpu_limit(str(features_engineering_config.get("n_workers", 1)))
+        .set_memory_limit("32G")
+    )
 
     # 4. Train a model
     train_model_config = load_component_config(
         "train_model", pipeline_config["uc_name"]
     )
-    train_model_task = train_model_step(
+    # Bin the training data once, as a LightGBM binary dataset
+    build_dataset_task = build_dataset_step(
         input_folder=features_engineering_task.outputs["output_folder"],
         config=train_model_config,
     ).set_memory_limit("32G")
+    train_model_task = train_model_step(
+        input_folder=build_dataset_task.outputs["output_folder"],
+        config=train_model_config,
+    ).set_memory_limit("32G")
 
     # 5. Evaluate a model
     # The previous loaded config can also be used later in the DAG
@@ -95,8 +107,10 @@ def training_pipeline_parallelized() -> None:
     # A. The first step is to load the pipeline config file
     pipeline_config = load_pipeline_config()
 
+    read_data_config = load_component_config("read_data", pipeline_config["uc_name"])
     get_data_task = get_data_step(
         input_bucket_raw=pipeline_config["input_bucket_raw"],
+        config=read_data_config,
     )
 
     # 2. Preparing the data
@@ -112,10 +126,14 @@ def training_pipeline_parallelized() -> None:
     features_engineering_config = load_component_config(
         "features_engineering", pipeline_config["uc_name"]
     )
-    features_engineering_task = features_engineering_step(
-        input_folder=prepare_data_task.outputs["output_folder"],
-        config=features_engineering_config,
-    ).set_memory_limit("32G")
+    features_engineering_task = (
+        features_engineering_step(
+            input_folder=prepare_data_task.outputs["output_folder"],
+            config=features_engineering_config,
+        )
+        .set_cpu_limit(str(features_engineering_config.get("n_workers", 1)))
+        .set_memory_limit("32G")
+    )
 
     # From this step, we will train 3 model with defferent 'num_boost_round'
     # To do so, we will override the training config files using inputs from the pipeline
@@ -123,14 +141,43 @@ def training_pipeline_parallelized() -> None:
     train_model_config = load_component_config(
         "train_model", pipeline_config["uc_name"]
     )
-    # // can simply be done with for loops
-    for obj in pipeline_config["objectives"]:
-        train_model_config["lgb_params"]["objective"] = obj
-        train_model_task = train_model_step(
-            input_folder=features_engineering_task.outputs["output_folder"],
-            config=train_model_config,
-        ).set_memory_limit("32G")
+    # Bin the training data once, as a LightGBM binary dataset shared by all the objectives
+    build_dataset_task = build_dataset_step(
+        input_folder=features_engineering_task.outputs["output_folder"],
+        config=train_model_config,
+    ).set_memory_limit("32G")
+    if pipeline_config.get("train_sweep"):
+        # A single container trains all the objectives on the same loaded data,
+        # the best model being evaluated and explained
+        train_model_config["sweep"] = [
+            {"objective": obj} for obj in pipeline_config["objectives"]
+        ]
+        train_model_config["sweep_workers"] = len(pipeline_config["objectives"])
+        # The threads of the models trained at the same time share the CPU limit
+        train_model_config["sweep_num_threads"] = pipeline_config.get(
+            "sweep_num_threads", 8
+        )
+        train_model_tasks = [
+            train_model_step(
+                input_folder=build_dataset_task.outputs["output_folder"],
+                config=train_model_config,
+            )
+            .set_cpu_limit(str(train_model_config["sweep_num_threads"]))
+            .set_memory_limit("32G")
+        ]
+    else:
+        # // can simply be done with for loops
+        train_model_tasks = []
+        for obj in pipeline_config["objectives"]:
+            train_model_config["lgb_params"]["objective"] = obj
+            train_model_tasks.append(
+                train_model_step(
+                    input_folder=build_dataset_task.outputs["output_folder"],
+                    config=train_model_config,
+                ).set_memory_limit("32G")
+            )
 
+    for train_model_task in train_model_tasks:
         # 5. Evaluate a model
         # The previous loaded config can also be used later in the DAG
         evaluate_model_task = evaluate_model_step(
@@ -162,8 +209,10 @@ def training_pipeline_with_conditiion() -> None:
     # A. The first step is to load the pipeline config file
     pipeline_config = load_pipeline_config()
 
+    read_data_config = load_component_config("read_data", pipeline_config["uc_name"])
     get_data_task = get_data_step(
         input_bucket_raw=pipeline_config["input_bucket_raw"],
+        config=read_data_config,
     )
 
     # 2. Preparing the data
@@ -179,10 +228,14 @@ def training_pipeline_with_conditiion() -> None:
     features_engineering_config = load_component_config(
         "features_engineering", pipeline_config["uc_name"]
     )
-    features_engineering_task = features_engineering_step(
-        input_folder=prepare_data_task.outputs["output_folder"],
-        config=features_engineering_config,
-    ).set_memory_limit("32G")
+    features_engineering_task = (
+        features_engineering_step(
+            input_folder=prepare_data_task.outputs["output_folder"],
+            config=features_engineering_config,
+        )
+        .set_cpu_limit(str(features_engineering_config.get("n_workers", 1)))
+        .set_memory_limit("32G")
+    )
 
     # From this step, we will train 3 model with defferent 'num_boost_round'
     # To do so, we will override the training config files using inputs from the pipeline
@@ -190,11 +243,16 @@ def training_pipeline_with_conditiion() -> None:
     train_model_config = load_component_config(
         "train_model", pipeline_config["uc_name"]
     )
+    # Bin the training data once, as a LightGBM binary dataset shared by all the objectives
+    build_dataset_task = build_dataset_step(
+        input_folder=features_engineering_task.outputs["output_folder"],
+        config=train_model_config,
+    ).set_memory_limit("32G")
     # // can simply be done with for loops
     for obj in pipeline_config["objectives"]:
         train_model_config["lgb_params"]["objective"] = obj
         train_model_task = train_model_step(
-            input_folder=features_engineering_task.outputs["output_folder"],
+            input_folder=build_dataset_task.outputs["output_folder"],
             config=train_model_config,
         ).set_memory_limit("32G")
 
@@ -221,17 +279,25 @@ def training_pipeline_with_conditiion() -> None:
                 "validation_start_date"
             ]
 
-            features_engineering_inference_task = features_engineering_step(
-                input_folder=prepare_data_task.outputs["output_folder"],
-                config=features_engineering_config,
-            ).set_memory_limit("32G")
+            features_engineering_inference_task = (
+                features_engineering_step(
+                    input_folder=prepare_data_task.outputs["output_folder"],
+                    config=features_engineering_config,
+                )
+                .set_cpu_limit(str(features_engineering_config.get("n_workers", 1)))
+                .set_memory_limit("32G")
+            )
 
-            train_model_task_inference = train_model_step(
+            build_dataset_task_inference = build_dataset_step(
                 input_folder=features_engineering_inference_task.outputs[
                     "output_folder"
                 ],
                 config=train_model_config,
             ).set_memory_limit("32G")
+            train_model_task_inference = train_model_step(
+                input_folder=build_dataset_task_inference.outputs["output_folder"],
+                config=train_model_config,
+            ).set_memory_limit("32G")
 
             # deploy the model to a folder
             deploying_task = deploying_model_step(
@@ -270,8 +336,10 @@ def inference_pipeline() -> None:
 
     # 1. Getting the data from BQ
     # Constant inputs can be send in the pipeline's config file
+    read_data_config = load_component_config("read_data", pipeline_config["uc_name"])
     get_data_task = get_data_step(
         input_bucket_raw=pipeline_config["input_bucket_raw"],
+        config=read_data_config,
     )
 
     # 2. Preparing the data
@@ -287,10 +355,18 @@ def inference_pipeline() -> None:
     features_engineering_config = load_component_config(
         "features_engineering", pipeline_config["uc_name"]
     )
-    features_engineering_task = features_engineering_step(
-        input_folder=prepare_data_task.outputs["output_folder"],
-        config=features_engineering_config,
-    ).set_memory_limit("32G")
+    # Only compute the features of the new dates when a feature table is persisted
+    features_engineering_config["incremental"] = pipeline_config.get(
+        "incremental_features", False
+    )
+    features_engineering_task = (
+        features_engineering_step(
+            input_folder=prepare_data_task.outputs["output_folder"],
+            config=features_engineering_config,
+        )
+        .set_cpu_limit(str(features_engineering_config.get("n_workers", 1)))
+        .set_memory_limit("32G")
+    )
 
     train_model_config = load_component_config(
         "train_model", pipeline_config["uc_name"]
@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from components.base_images.utils.artifacts import read_artifact
+from components.base_images.utils.ingestion import ingest_sources
+from components.base_images.utils.storage import LocalBackend
+
+CONFIG_PATH = (
+    Path(__file__).parents[1] / "config/components/read_data/tutorial/config.json"
+)
+
+
+def _write_sales(path: Path, days: np.ndarray, first_day: int) -> None:
+    sales = pd.DataFrame(
+        {
+            "id": ["A_1_CA_1", "A_2_CA_1"],
+            "item_id": ["A_1", "A_2"],
+            "dept_id": "A",
+            "cat_id": "A",
+            "store_id": "CA_1",
+            "state_id": "CA",
+        }
+    )
+    for i in range(days.shape[1]):
+        sales[f"d_{first_day + i}"] = days[:, i]
+    sales.to_csv(path, index=False)
+
+
+def test_ingest_sales_with_empty_inference_days(tmp_path):
+    sources = json.loads(CONFIG_PATH.read_text())["sources"]
+    sources = {name: sources[name] for name in ["sales_train", "sales_inference"]}
+    bucket = tmp_path / "raw"
+    bucket.mkdir()
+    _write_sales(bucket / "sales_train.csv", np.array([[1, 0, 3], [2, 2, 0]]), 1)
+    # The inference days are the days to forecast, without sales yet
+    _write_sales(bucket / "sales_inference.csv", np.full((2, 2), np.nan), 4)
+
+    output_folder = tmp_path / "output"
+    cached = ingest_sources(LocalBackend(str(tmp_path)), "raw", sources, output_folder)
+
+    assert cached == {"sales_train": False, "sales_inference": False}
+    sales_train = read_artifact(output_folder, "sales_train")
+    sales_inference = read_artifact(output_folder, "sales_inference")
+    assert (sales_train[["d_1", "d_2", "d_3"]].dtypes == "int16").all()
+    assert (sales_inference[["d_4", "d_5"]].dtypes == "float32").all()
+    assert sales_inference[["d_4", "d_5"]].isna().all().all()
+    assert isinstance(sales_inference["item_id"].dtype, pd.CategoricalDtype)
+
+
+def test_ingest_sources_skips_unchanged_sources(tmp_path):
+    sources = json.loads(CONFIG_PATH.read_text())["sources"]
+    sources = {"sales_train": sources["sales_train"]}
+    bucket = tmp_path / "raw"
+    bucket.mkdir()
+    _write_sales(bucket / "sales_train.csv", np.array([[1, 0], [2, 2]]), 1)
+    backend, cache_folder = LocalBackend(str(tmp_path)), str(tmp_path / "cache")
+
+    first = ingest_sources(backend, "raw", sources, tmp_path / "run_1", cache_folder)
+    second = ingest_sources(backend, "raw", sources, tmp_path / "run_2", cache_folder)
+
+    assert first == {"sales_train": False} and second == {"sales_train": True}
+    pd.testing.assert_frame_equal(
+        read_artifact(tmp_path / "run_1", "sales_train"),
+        read_artifact(tmp_path / "run_2", "sales_train"),
+    )